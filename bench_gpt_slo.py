@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка бюджета на ответ GPT и предохранителя (gpt_slo.py) на симуляции «деградировавшего» OpenAI.
+
+    python bench_gpt_slo.py            # сценарии и время до первого ответа пользователю
+    python bench_gpt_slo.py --check    # exit 1, если фолбэк не уложился в бюджет или предохранитель ведёт себя не так
+
+Сценарии: быстрый GPT; медленный GPT (фолбэк в бюджет + досылка); GPT не отвечает вовсе (досылка теряется);
+серия медленных вызовов размыкает предохранитель, следующие сообщения GPT не ждут,
+после успешной проверки здоровья предохранитель замыкается. Плюс сквозной прогон через Dispatcher бота.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+import gpt_slo
+
+# ---------- СЦЕНАРИИ ----------
+
+class FakeGpt:
+    """ask_gpt с управляемой задержкой; None — «завис» навсегда."""
+
+    def __init__(self) -> None:
+        self.delay: float | None = 0.0
+        self.healthy = False
+
+    async def ask(self, user_id: int, text: str) -> str | None:
+        if self.delay is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.delay)
+        return f"ответ на «{text}»"
+
+    async def probe(self) -> bool:
+        return self.healthy
+
+async def scenarios(budget: float, probe: float) -> Tuple[List[str], List[str]]:
+    fake = FakeGpt()
+    gate = gpt_slo.ReplyDeadline(
+        fake.ask, budget=budget, followup=True, followup_timeout=budget * 4,
+        breaker=gpt_slo.CircuitBreaker(fails=3, probe_interval=probe, probe=fake.probe),
+    )
+    report, problems = [], []
+    late: List[str] = []
+
+    async def send(answer: str) -> None:
+        late.append(answer)
+
+    async def ask(text: str) -> Tuple[gpt_slo.Outcome, float]:
+        t0 = time.perf_counter()
+        out = await gate.ask(1, text)
+        gate.follow_up(out, send)
+        return out, (time.perf_counter() - t0) * 1000
+
+    # 1) быстрый GPT
+    fake.delay = budget / 4
+    out, ms = await ask("быстро")
+    report.append(f"быстрый GPT: {out.status}, {ms:.0f} мс")
+    if out.status != "ok":
+        problems.append("быстрый GPT не ответил в бюджет")
+
+    # 2) медленный GPT: фолбэк в бюджет, ответ досылается
+    fake.delay = budget * 2
+    out, ms = await ask("медленно")
+    report.append(f"медленный GPT: {out.status}, пользователь получил фолбэк через {ms:.0f} мс (бюджет {budget * 1000:.0f})")
+    if out.status != "timeout" or ms > budget * 1000 * 1.5:
+        problems.append(f"фолбэк не уложился в бюджет: {ms:.0f} мс")
+    await asyncio.sleep(budget * 1.5)
+    report.append(f"  досылка: {len(late)} сообщ.")
+    if len(late) != 1:
+        problems.append("поздний ответ не дослан")
+
+    # 3) GPT не отвечает — досылка теряется по followup_timeout, третья неудача размыкает предохранитель
+    fake.delay = None
+    out, ms = await ask("завис")
+    report.append(f"GPT завис: {out.status}, {ms:.0f} мс; предохранитель {gate.breaker.state.value}")
+    fake.delay = budget * 2
+    out, ms = await ask("ещё медленно")
+    report.append(f"третий медленный: {out.status}, {ms:.0f} мс; предохранитель {gate.breaker.state.value}")
+    if gate.breaker.state is not gpt_slo.BreakerState.OPEN:
+        problems.append("предохранитель не разомкнулся после 3 неудач подряд")
+
+    # 4) разомкнут — GPT не ждём вовсе
+    out, ms = await ask("пока разомкнут")
+    report.append(f"при разомкнутом: {out.status}, {ms:.1f} мс")
+    if out.status != "skipped" or ms > 5:
+        problems.append("при разомкнутом предохранителе запрос всё равно ждал GPT")
+
+    # 5) проверка здоровья: сначала неудачная, потом успешная
+    await asyncio.sleep(probe * 1.5)
+    still_open = gate.breaker.state is not gpt_slo.BreakerState.CLOSED
+    fake.healthy, fake.delay = True, budget / 4
+    await asyncio.sleep(probe * 1.5)
+    report.append(f"проверки здоровья: {gate.breaker.probes}, предохранитель {gate.breaker.state.value}")
+    if not still_open or gate.breaker.state is not gpt_slo.BreakerState.CLOSED:
+        problems.append("предохранитель не дождался успешной проверки здоровья")
+    out, ms = await ask("снова работает")
+    if out.status != "ok":
+        problems.append("после замыкания GPT не отвечает")
+
+    await asyncio.sleep(budget * 4)   # досылка «зависшего» истекает
+    m = gate.metrics()
+    report.append(f"метрики: {m}")
+    if m["followups_lost"] < 1 or m["deadline_misses"] != 3 or m["breaker_trips"] != 1:
+        problems.append(f"метрики не сходятся: {m}")
+    await gate.close()
+    return report, problems
+
+async def end_to_end(budget: float) -> Tuple[List[str], List[str]]:
+    """Сообщение, на которое GPT отвечает медленно: пользователь сразу получает подсказки, потом — досылку."""
+    tmp = tempfile.mkdtemp(prefix="bench_gpt_slo_")
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ["DATA_ROOT"] = tmp
+    os.environ["TENANTS_FILE"] = os.path.join(tmp, "tenants.json")
+    from pathlib import Path
+
+    from aiogram.methods import SendMessage
+    from aiogram.types import Chat, Message, Update, User
+
+    import main
+
+    main.DIALOG_LOG = Path(tmp) / "dialog_log.txt"
+    fake = FakeGpt()
+    fake.delay = budget * 2
+    gate = main.gpt_gate
+    gate.ask_fn, gate.enabled, gate.budget, gate.followup_timeout = fake.ask, (lambda: True), budget, budget * 4
+    main.intent_model.ENABLED = False   # проверяем именно путь FAQ-промах → GPT
+    main.intent_model.load()
+
+    chat = Chat(id=1, type="private")
+    sent: List[Tuple[float, str]] = []
+
+    async def fake_telegram(make_request, bot, method):
+        text = method.text if isinstance(method, SendMessage) else ""
+        sent.append((time.perf_counter(), text))
+        return Message(message_id=len(sent), date=datetime.now(), chat=chat, text=text)
+
+    main.bot.session.middleware(fake_telegram)
+    update = Update(update_id=1, message=Message(
+        message_id=1, date=datetime.now(), chat=chat,
+        from_user=User(id=1, is_bot=False, first_name="Bench"), text="а вы свадьбы снимаете",
+    ))
+    t0 = time.perf_counter()
+    await main.dp.feed_update(main.bot, update)
+    await asyncio.sleep(budget * 3)
+    await main.outbox.close(timeout=1)
+    await gate.close()
+
+    report, problems = [], []
+    for ts, text in sent:
+        report.append(f"  +{(ts - t0) * 1000:5.0f} мс: {text[:60]!r}")
+    first = (sent[0][0] - t0) * 1000 if sent else float("inf")
+    if first > budget * 1000 * 1.5:
+        problems.append(f"сквозной: первый ответ через {first:.0f} мс при бюджете {budget * 1000:.0f}")
+    if not any(text.startswith("💬 К вопросу") for _, text in sent):
+        problems.append("сквозной: поздний ответ GPT не дослан")
+    return ["сквозной прогон (бюджет {:.0f} мс, GPT {:.0f} мс):".format(budget * 1000, budget * 2000)] + report, problems
+
+# ---------- MAIN ----------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--budget", type=float, default=0.2, help="бюджет на ответ в симуляции, с")
+    ap.add_argument("--probe", type=float, default=0.2, help="интервал проверки здоровья, с")
+    ap.add_argument("--check", action="store_true", help="вернуть код 1 при проблемах")
+    args = ap.parse_args()
+
+    report, problems = asyncio.run(scenarios(args.budget, args.probe))
+    e2e_report, e2e_problems = asyncio.run(end_to_end(args.budget))
+    print("\n".join(report + e2e_report))
+    for p in problems + e2e_problems:
+        print(f"FAIL: {p}")
+    return 1 if args.check and (problems or e2e_problems) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка сетевого слоя (net.py) на локальных заглушках Telegram Bot API и OpenAI.
+
+    python bench_net.py              # отчёт: рукопожатия, переиспользование, время запросов
+    python bench_net.py --check      # exit 1, если метрики разошлись с сервером или соединения не переиспользуются
+    python bench_net.py --idle 0     # без паузы простоя (быстрее)
+
+Заглушки на 127.0.0.1 сами считают принятые TCP-соединения — метрики клиента сверяются с ними.
+Сценарии: прогрев → первый запрос без рукопожатия; серия последовательных и параллельных запросов;
+пауза дольше keep-alive httpx по умолчанию (5 с) — настроенный пул соединение сохраняет;
+закрытие пулов — на сервере не остаётся открытых соединений.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+
+import net
+
+TOKEN = "123456:bench"
+
+class StandIn:
+    """aiohttp-сервер, который помнит транспорты входящих соединений."""
+
+    def __init__(self, name: str, delay: float) -> None:
+        self.name = name
+        self.delay = delay
+        self.transports: set = set()
+        self.app = web.Application()
+        self.runner: web.AppRunner | None = None
+        self.url = ""
+
+    @property
+    def accepted(self) -> int:
+        return len(self.transports)
+
+    @property
+    def open(self) -> int:
+        return sum(1 for t in self.transports if not t.is_closing())
+
+    def seen(self, request: web.Request) -> None:
+        self.transports.add(request.transport)
+
+    async def start(self) -> None:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+def telegram_stand_in(delay: float) -> StandIn:
+    srv = StandIn("telegram", delay)
+
+    async def method(request: web.Request) -> web.Response:
+        srv.seen(request)
+        await asyncio.sleep(srv.delay)
+        name = request.match_info["method"].lower()
+        if name == "getme":
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench"}
+        else:
+            form = await request.post()
+            result = {"message_id": 1, "date": int(time.time()), "chat": {"id": int(form.get("chat_id", 1)), "type": "private"},
+                      "text": form.get("text", "")}
+        return web.json_response({"ok": True, "result": result})
+
+    srv.app.router.add_post("/bot{token}/{method}", method)
+    return srv
+
+def openai_stand_in(delay: float) -> StandIn:
+    srv = StandIn("openai", delay)
+
+    async def completions(request: web.Request) -> web.Response:
+        srv.seen(request)
+        await asyncio.sleep(srv.delay)
+        return web.json_response({
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+        })
+
+    async def head(request: web.Request) -> web.Response:
+        srv.seen(request)
+        return web.Response(status=404)
+
+    srv.app.router.add_post("/v1/chat/completions", completions)
+    srv.app.router.add_route("HEAD", "/v1/", head)
+    return srv
+
+# ---------- СЦЕНАРИИ ----------
+
+async def run_telegram(srv: StandIn, n: int, parallel: int) -> Dict:
+    cfg = net.EndpointConfig("telegram", limit=parallel, keepalive=60, connect_timeout=2, read_timeout=10, prewarm=2)
+    session = net.PooledSession(cfg, api=TelegramAPIServer.from_base(srv.url))
+    bot = Bot(TOKEN, session=session)
+    await session.prewarm(bot)
+    warm = session.stats.connections
+    t0 = time.perf_counter()
+    await bot.send_message(1, "first")
+    first_ms = (time.perf_counter() - t0) * 1000
+    after_first = session.stats.connections
+    for i in range(n):
+        await bot.send_message(1, f"seq {i}")
+    await asyncio.gather(*(bot.send_message(i, "par") for i in range(parallel * 3)))
+    stats = session.stats.as_dict()
+    accepted = srv.accepted
+    await session.close()
+    await asyncio.sleep(0.1)
+    return {"stats": stats, "server_accepted": accepted, "server_open_after_close": srv.open,
+            "prewarmed": warm, "first_handshakes": after_first - warm, "first_ms": first_ms}
+
+async def run_openai(srv: StandIn, n: int, idle: float, tuned: bool) -> Dict:
+    from openai import AsyncOpenAI
+
+    base = f"{srv.url}/v1/"
+    if tuned:
+        cfg = net.EndpointConfig("openai", limit=10, keepalive=120, connect_timeout=2, read_timeout=10, prewarm=1)
+        pool = net.HttpxPool(cfg)
+        cli = AsyncOpenAI(api_key="bench", base_url=base, http_client=pool.client, timeout=pool.timeout, max_retries=0)
+        await pool.prewarm(base)
+        stats = pool.stats
+    else:   # как было: AsyncOpenAI с httpx по умолчанию — соединения считаем только на сервере
+        pool, stats = None, None
+        cli = AsyncOpenAI(api_key="bench", base_url=base, max_retries=0)
+
+    async def ask() -> float:
+        t = time.perf_counter()
+        await cli.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+        return (time.perf_counter() - t) * 1000
+
+    before = srv.accepted
+    first_ms = await ask()
+    first_handshakes = srv.accepted - before
+    for _ in range(n):
+        await ask()
+    after_idle_handshakes, idle_ms = 0, 0.0
+    if idle > 0:
+        await asyncio.sleep(idle)
+        before = srv.accepted
+        idle_ms = await ask()
+        after_idle_handshakes = srv.accepted - before
+    accepted = srv.accepted
+    if pool is not None:
+        await pool.aclose()
+    else:
+        await cli.close()
+    await asyncio.sleep(0.1)
+    return {"stats": stats.as_dict() if stats else None, "server_accepted": accepted, "server_open_after_close": srv.open,
+            "first_handshakes": first_handshakes, "first_ms": first_ms,
+            "idle_handshakes": after_idle_handshakes, "idle_ms": idle_ms}
+
+# ---------- MAIN ----------
+
+def _line(name: str, r: Dict) -> str:
+    s = r["stats"]
+    client = (f"клиент: соединений {s['connections']}, переиспользовано {s['reuse_rate']:.0%}; " if s else "клиент: — ; ")
+    text = (f"{name:<22} {client}сервер принял {r['server_accepted']}, открыто после close {r['server_open_after_close']}; "
+            f"первый запрос: рукопожатий {r['first_handshakes']}, {r['first_ms']:.1f} мс")
+    if "idle_handshakes" in r and r["idle_ms"]:
+        text += f"; после простоя: рукопожатий {r['idle_handshakes']}, {r['idle_ms']:.1f} мс"
+    return text
+
+async def amain(args) -> int:
+    problems: List[str] = []
+    tg = telegram_stand_in(args.delay)
+    await tg.start()
+    r_tg = await run_telegram(tg, args.requests, args.parallel)
+    await tg.stop()
+
+    results = {}
+    srv = openai_stand_in(args.delay)   # прогон вхолостую: первый вызов SDK строит модели pydantic — не путаем с сетью
+    await srv.start()
+    await run_openai(srv, 0, 0, tuned=False)
+    await srv.stop()
+    for tuned in (True, False):
+        srv = openai_stand_in(args.delay)
+        await srv.start()
+        results[tuned] = await run_openai(srv, args.requests, args.idle, tuned)
+        await srv.stop()
+    r_ai, r_base = results[True], results[False]
+
+    print(_line("telegram (net)", r_tg))
+    print(_line("openai (net)", r_ai))
+    print(_line("openai (по умолчанию)", r_base))
+
+    s = r_tg["stats"]
+    if s["connections"] != r_tg["server_accepted"]:
+        problems.append(f"telegram: клиент насчитал {s['connections']} соединений, сервер принял {r_tg['server_accepted']}")
+    if s["connections"] > args.parallel:
+        problems.append(f"telegram: соединений {s['connections']} больше лимита пула {args.parallel}")
+    if r_tg["first_handshakes"]:
+        problems.append("telegram: первый запрос после прогрева открыл новое соединение")
+    s = r_ai["stats"]
+    if s["connections"] != r_ai["server_accepted"]:
+        problems.append(f"openai: клиент насчитал {s['connections']} соединений, сервер принял {r_ai['server_accepted']}")
+    if r_ai["first_handshakes"]:
+        problems.append("openai: первый запрос после прогрева открыл новое соединение")
+    if args.idle > 0 and r_ai["idle_handshakes"]:
+        problems.append("openai: после простоя соединение не сохранилось")
+    for name, r in (("telegram", r_tg), ("openai", r_ai)):
+        if r["stats"]["reuse_rate"] < args.min_reuse:
+            problems.append(f"{name}: переиспользование {r['stats']['reuse_rate']:.0%} < {args.min_reuse:.0%}")
+        if r["server_open_after_close"]:
+            problems.append(f"{name}: после close на сервере открыто {r['server_open_after_close']} соединений")
+
+    for p in problems:
+        print(f"FAIL: {p}")
+    return 1 if args.check and problems else 0
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=30, help="последовательных запросов на сценарий")
+    ap.add_argument("--parallel", type=int, default=4, help="лимит пула Telegram и число параллельных отправок")
+    ap.add_argument("--idle", type=float, default=6.0, help="пауза простоя перед последним запросом OpenAI, с")
+    ap.add_argument("--delay", type=float, default=0.002, help="задержка ответа заглушек, с")
+    ap.add_argument("--min-reuse", type=float, default=0.9)
+    ap.add_argument("--check", action="store_true", help="вернуть код 1 при проблемах")
+    return asyncio.run(amain(ap.parse_args()))
+
+if __name__ == "__main__":
+    sys.exit(main())
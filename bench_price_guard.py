@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк и регрессия для price_guard на корпусе ответов GPT (price_guard_corpus.jsonl).
+
+    python bench_price_guard.py            # вердикты, точность против старой проверки, время
+    python bench_price_guard.py --check    # exit 1, если хоть один вердикт разошёлся с ожидаемым
+
+Строка корпуса: {"expect": "pass|fixed|blocked", "text": "..."}.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+import price_guard
+
+CORPUS = Path(__file__).parent / "price_guard_corpus.jsonl"
+
+# Проверка, как она была до price_guard: «пропустить, если любое известное число встречается где-то в тексте»
+LEGACY_NUMBERS = {"2700", "3700", "4600", "3500", "2000", "3300", "4100", "2200", "3200", "4400", "400", "600"}
+
+def legacy_untrusted(answer: str) -> bool:
+    ans = answer.lower()
+    if "₽" not in ans and "руб" not in ans:
+        return False
+    if "50%" in ans or "50 %" in ans:
+        return False
+    for n in LEGACY_NUMBERS:
+        if n in ans:
+            return False
+    return True
+
+def load(path: Path) -> list[dict]:
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", type=Path, default=CORPUS)
+    ap.add_argument("--number", type=int, default=2000, help="прогонов корпуса для замера времени")
+    ap.add_argument("--check", action="store_true", help="вернуть код 1 при расхождении вердиктов")
+    args = ap.parse_args()
+
+    rows = load(args.corpus)
+    mismatches = legacy_wrong = 0
+    for r in rows:
+        verdict = price_guard.check(r["text"])
+        if verdict.action != r["expect"]:
+            mismatches += 1
+            bad = [f"{f.value} ({f.kind})" for f in verdict.bad]
+            print(f"MISMATCH ждали {r['expect']}, получили {verdict.action}: {r['text'][:70]!r} {bad}")
+        # старая проверка умела только «пропустить целиком / заблокировать целиком»
+        if legacy_untrusted(r["text"]) != (r["expect"] != "pass"):
+            legacy_wrong += 1
+
+    texts = [r["text"] for r in rows]
+    new_us = min(timeit.repeat(lambda: [price_guard.check(t) for t in texts], number=args.number, repeat=3))
+    old_us = min(timeit.repeat(lambda: [legacy_untrusted(t) for t in texts], number=args.number, repeat=3))
+    per = 1e6 / (args.number * len(texts))
+
+    print(f"Корпус: {len(rows)} ответов")
+    print(f"price_guard: совпало {len(rows) - mismatches}/{len(rows)}, {new_us * per:6.1f} мкс/ответ")
+    print(f"старая проверка: ошибок {legacy_wrong}/{len(rows)}, {old_us * per:6.1f} мкс/ответ")
+    return 1 if args.check and mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
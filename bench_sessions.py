@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк форматов сессий memory_store: время encode/decode, байт на сессию,
+память в процессе (dict-и против записей) и цикл одного сообщения диалога на диске
+(append → профиль → история → append) — как было (dict + json), записи без кэша и с кэшем.
+
+    python bench_sessions.py
+    python bench_sessions.py --history 50 --sessions 2000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import timeit
+import tracemalloc
+from pathlib import Path
+
+os.environ["DATA_ROOT"] = tempfile.mkdtemp(prefix="bench_sessions_")   # сессии пишутся во временный каталог
+os.environ["TENANTS_FILE"] = os.path.join(os.environ["DATA_ROOT"], "tenants.json")
+
+import memory_store as ms
+
+SAMPLE_TEXTS = (
+    "Здравствуйте! Сколько стоит индивидуальный альбом в сад?",
+    "📗 Индивидуальный альбом (детский сад) — Мини **2700 ₽**, Лайт **3700 ₽**, Макси **4600 ₽**.",
+    "А до какого числа нужно определиться?",
+    "Цены действуют при заказе от 15 альбомов и съёмке до марта.",
+    "Спасибо!",
+)
+
+def make_session(history: int, seed: int = 0) -> dict:
+    rnd = random.Random(seed)
+    return {
+        "history": [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": rnd.choice(SAMPLE_TEXTS)}
+            for i in range(history)
+        ],
+        "profile": {"level": "детский сад", "org_number": "27", "album_type": "индивидуальный",
+                    "count_children": 18, "contact_method": "VK"},
+        "updated_at": "2026-10-19 12:00:00",
+    }
+
+def legacy_encode(d: dict) -> bytes:
+    # как было до типизированных записей: json.dumps(dict, indent=2)
+    return json.dumps(d, ensure_ascii=False, indent=2).encode("utf-8")
+
+def legacy_decode(b: bytes) -> dict:
+    return json.loads(b.decode("utf-8"))
+
+def _per_call_us(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+def _mem_kb(factory, n: int) -> float:
+    tracemalloc.start()
+    keep = [factory(i) for i in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return size / 1024
+
+def legacy_cycle(path: Path, text: str) -> None:
+    """Как было до записей: каждое обращение читает и парсит файл, запись — json.dumps(indent=2)."""
+    def load() -> dict:
+        return legacy_decode(path.read_bytes()) if path.exists() else {"history": [], "profile": {}}
+
+    def append(role: str, content: str) -> None:
+        d = load()
+        d["history"] = (d["history"] + [{"role": role, "content": content}])[-50:]
+        path.write_bytes(legacy_encode(d))
+
+    append("user", text)
+    load()["profile"]
+    load()["history"][-12:]
+    append("assistant", text)
+
+def records_cycle(user_id: int, text: str) -> None:
+    ms.append_message(user_id, "user", text)
+    ms.get_profile(user_id)
+    ms.get_history(user_id, limit=12)
+    ms.append_message(user_id, "assistant", text)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--history", type=int, default=50, help="сообщений в истории (кап memory_store)")
+    ap.add_argument("--sessions", type=int, default=1000, help="сессий для замера памяти")
+    ap.add_argument("--number", type=int, default=500, help="вызовов на замер")
+    args = ap.parse_args()
+
+    raw = make_session(args.history)
+    session = ms.Session.from_dict(raw)
+
+    rows = [("json (legacy dict)", lambda: legacy_encode(raw), legacy_decode, legacy_encode(raw))]
+    rows.append(("json (records)", lambda: ms.encode_json(session), ms.decode, ms.encode_json(session)))
+    rows.append(("bin", lambda: ms.encode_bin(session), ms.decode, ms.encode_bin(session)))
+    if ms.msgpack is not None:
+        rows.append(("msgpack", lambda: ms.encode_msgpack(session), ms.decode, ms.encode_msgpack(session)))
+
+    print(f"Сессия: {args.history} сообщений истории + профиль\n")
+    print(f"{'формат':<20}{'байт':>8}{'encode, мкс':>14}{'decode, мкс':>14}")
+    for name, enc, dec, blob in rows:
+        enc_us = _per_call_us(enc, args.number)
+        dec_us = _per_call_us(lambda: dec(blob), args.number)
+        print(f"{name:<20}{len(blob):>8}{enc_us:>14.1f}{dec_us:>14.1f}")
+
+    # роли в данных, пришедших из json, — разные объекты строк; в записях они интернированы
+    dicts_kb = _mem_kb(lambda i: legacy_decode(legacy_encode(make_session(args.history, i))), args.sessions)
+    recs_kb = _mem_kb(lambda i: ms.decode(ms.encode_bin(ms.Session.from_dict(make_session(args.history, i)))),
+                      args.sessions)
+    print(f"\nПамять на {args.sessions} сессий в процессе:")
+    print(f"  dict-и из json:     {dicts_kb:10.0f} КБ")
+    print(f"  Session/HistoryEntry: {recs_kb:8.0f} КБ")
+
+    # цикл одного сообщения (как в main.text_router + openai_helper.ask_gpt) на заполненной сессии
+    text = SAMPLE_TEXTS[1]
+    legacy_path = ms._sessions_dir() / "legacy.json"
+    legacy_path.write_bytes(legacy_encode(raw))
+    print(f"\nЦикл сообщения на диске (история {args.history}), мкс:")
+    print(f"  json (legacy dict):   {_per_call_us(lambda: legacy_cycle(legacy_path, text), args.number // 5):8.1f}")
+    cache_size = ms.SESSION_CACHE
+    for fmt in ("json", "bin"):
+        ms.SESSION_FORMAT = fmt
+        for cached in (False, True):
+            ms.SESSION_CACHE = cache_size if cached else 0
+            ms._cache.clear()
+            ms._save(1, ms.Session.from_dict(raw))
+            us = _per_call_us(lambda: records_cycle(1, text), args.number // 5)
+            print(f"  {fmt + (' + кэш' if cached else ''):<20}{us:9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк старта бота: разбивка `python -X importtime` и время до первого ответа.
+
+    python bench_startup.py                   # отчёт
+    python bench_startup.py --save-baseline   # записать текущие замеры в bench_startup_baseline.json
+    python bench_startup.py --check           # регрессия: exit 1, если старт заметно медленнее базы
+                                              # или тяжёлые модули грузятся eagerly
+
+Дочерний процесс импортирует `main` (без сети: BOT_TOKEN фиктивный, ответы
+перехватываются request-middleware) и прогоняет один FAQ-апдейт через Dispatcher.
+Замеры идут без `-X importtime` (он сам замедляет импорт) — разбивка берётся отдельным прогоном.
+Абсолютные миллисекунды зависят от машины, поэтому сравниваются отношения: время `import main`
+и первого ответа делится на время импорта зависимостей (aiogram, loguru, dotenv), замеренное
+в тех же условиях, и сверяется с базой с допуском `--tolerance`.
+Проверяется также, что тяжёлые модули (openai) не грузятся до первого обращения к GPT.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from envcfg import env_num
+
+ROOT = Path(__file__).parent
+LAZY_MODULES = ("openai",)   # не должны импортироваться при старте и на FAQ-ответе
+BASELINE = ROOT / "bench_startup_baseline.json"
+REFERENCE_IMPORTS = ("aiogram", "aiogram.client.session.aiohttp", "loguru", "dotenv")   # «пол» стоимости старта
+IMPORT_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+def _child() -> None:
+    t0 = time.perf_counter()
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ["OPENAI_PREWARM"] = "0"
+    tmp = Path(tempfile.mkdtemp(prefix="bench_startup_"))
+    os.environ["DATA_ROOT"] = str(tmp)                       # не трогаем настоящие сессии и логи
+    os.environ["TENANTS_FILE"] = str(tmp / "tenants.json")   # один тенант по умолчанию
+    sys.path.insert(0, str(ROOT))
+
+    import main
+    t_import = time.perf_counter()
+    lazy_after_import = [m for m in LAZY_MODULES if m in sys.modules]
+
+    import asyncio
+    from datetime import datetime
+    from aiogram.methods import SendMessage
+    from aiogram.types import Chat, Message, Update, User
+
+    main.DIALOG_LOG = tmp / "dialog_log.txt"
+
+    chat = Chat(id=1, type="private")
+    replies: list[float] = []
+
+    async def fake_telegram(make_request, bot, method):
+        replies.append(time.perf_counter())
+        text = method.text if isinstance(method, SendMessage) else ""
+        return Message(message_id=len(replies), date=datetime.now(), chat=chat, text=text)
+
+    async def run() -> None:
+        main.bot.session.middleware(fake_telegram)
+        update = Update(update_id=1, message=Message(
+            message_id=1, date=datetime.now(), chat=chat,
+            from_user=User(id=1, is_bot=False, first_name="Bench"),
+            text="общий альбом сад",
+        ))
+        await main.dp.feed_update(main.bot, update)
+        await main.outbox.close(timeout=1)
+
+    asyncio.run(run())
+    print(json.dumps({
+        "import_ms": (t_import - t0) * 1000,
+        "first_reply_ms": (replies[0] - t0) * 1000 if replies else None,
+        "lazy_after_import": lazy_after_import,
+        "lazy_after_reply": [m for m in LAZY_MODULES if m in sys.modules],
+    }))
+
+def _child_reference() -> None:
+    t0 = time.perf_counter()
+    import importlib
+    for name in REFERENCE_IMPORTS:
+        importlib.import_module(name)
+    print(json.dumps({"reference_ms": (time.perf_counter() - t0) * 1000}))
+
+def _run_child(flag: str, *, importtime: bool = False) -> tuple[dict, float, str]:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + [str(Path(__file__).resolve()), flag]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT)
+    wall = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        raise SystemExit(1)
+    return json.loads(proc.stdout.strip().splitlines()[-1]), wall, proc.stderr
+
+def _top_imports(stderr: str, n: int) -> list[tuple[str, int]]:
+    """Самые дорогие пакеты верхнего уровня по cumulative-времени (мс)."""
+    rows = []
+    for m in IMPORT_RE.finditer(stderr):
+        depth = (len(m.group(3)) - 1) // 2
+        if depth <= 1:
+            rows.append((m.group(4), int(m.group(2)) // 1000))
+    rows.sort(key=lambda r: r[1], reverse=True)
+    return rows[:n]
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--child-reference", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--runs", type=int, default=5, help="сколько запусков (берём медиану)")
+    ap.add_argument("--top", type=int, default=15, help="сколько строк importtime показать")
+    ap.add_argument("--check", action="store_true", help="вернуть код 1 при регрессии")
+    ap.add_argument("--save-baseline", action="store_true", help=f"записать отношения в {BASELINE.name}")
+    ap.add_argument("--tolerance", type=float, default=env_num("BENCH_STARTUP_TOLERANCE", 1.3),
+                    help="во сколько раз отношение может превысить базу")
+    args = ap.parse_args()
+    if args.child:
+        _child()
+        return 0
+    if args.child_reference:
+        _child_reference()
+        return 0
+
+    results, refs, wall = [], [], []
+    for _ in range(max(1, args.runs)):   # чередуем: дрейф нагрузки на машине влияет на оба замера одинаково
+        ref, _, _ = _run_child("--child-reference")
+        refs.append(ref["reference_ms"])
+        res, ms, _ = _run_child("--child")
+        results.append(res)
+        wall.append(ms)
+    _, _, stderr = _run_child("--child", importtime=True)   # только для разбивки, в замеры не идёт
+
+    def median(values: list[float]) -> float:
+        values = sorted(values)
+        return values[len(values) // 2]
+
+    ref_ms = median(refs)
+    import_ms = median([r["import_ms"] for r in results])
+    reply_ms = median([r["first_reply_ms"] or float("inf") for r in results])
+    ratios = {"import": import_ms / ref_ms, "reply": reply_ms / ref_ms}
+    last = results[-1]
+
+    print("Самые дорогие импорты (cumulative, мс, под -X importtime):")
+    for name, ms in _top_imports(stderr, args.top):
+        print(f"  {ms:7d}  {name}")
+    print()
+    print(f"зависимости (эталон): {ref_ms:8.1f} мс")
+    print(f"import main:          {import_ms:8.1f} мс  (x{ratios['import']:.2f} эталона)")
+    print(f"первый ответ (FAQ):   {reply_ms:8.1f} мс  (x{ratios['reply']:.2f} эталона)")
+    print(f"процесс целиком:      {median(wall):8.1f} мс (вкл. старт интерпретатора)")
+    print(f"ленивые модули после импорта: {last['lazy_after_import'] or '—'}")
+    print(f"ленивые модули после ответа:  {last['lazy_after_reply'] or '—'}")
+
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps({k: round(v, 3) for k, v in ratios.items()}, indent=2) + "\n", encoding="utf-8")
+        print(f"база записана в {BASELINE.name}")
+    if not args.check:
+        return 0
+    failures = []
+    if last["lazy_after_import"] or last["lazy_after_reply"]:
+        failures.append(f"тяжёлые модули загружены eagerly: {last['lazy_after_reply']}")
+    if BASELINE.exists():
+        base = json.loads(BASELINE.read_text(encoding="utf-8"))
+        for key, label in (("import", "import main"), ("reply", "первый ответ")):
+            if key in base and ratios[key] > base[key] * args.tolerance:
+                failures.append(f"{label}: x{ratios[key]:.2f} эталона > базы x{base[key]:.2f} * {args.tolerance:g}")
+    else:
+        print(f"нет {BASELINE.name} — сравнение с базой пропущено (запишите: --save-baseline)")
+    for f in failures:
+        print(f"FAIL: {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
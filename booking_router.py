@@ -3,27 +3,21 @@ from __future__ import annotations
 from pathlib import Path
 from datetime import datetime
 import re
-import os
 
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from dotenv import load_dotenv
 
+import price_catalog
+import tenants
 from knowledge_base import normalize
 from memory_store import update_profile
+from send_queue import Priority, send_priority
 
 router = Router()
 
-# --- ENV for OWNER notification ---
-env_path = Path(__file__).parent / ".env"
-if env_path.exists():
-    load_dotenv(env_path)
-
-OWNER_ID = int(os.getenv("OWNER_ID", "0") or "0")
-
 # --- States ---
 class Survey(StatesGroup):
     level = State()            # школа/сад
@@ -42,9 +36,9 @@ def _now() -> str:
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 def _lead_path() -> Path:
-    p = Path(__file__).parent / "data"
-    p.mkdir(exist_ok=True)
-    return p / "leads.csv"
+    p = tenants.current().leads_path   # у каждого тенанта свой leads.csv
+    p.parent.mkdir(parents=True, exist_ok=True)
+    return p
 
 def save_lead(row: list[str]) -> None:
     path = _lead_path()
@@ -87,22 +81,28 @@ def summary_text(data: dict) -> str:
         f"• Связь: **{data.get('contact_method','–')} — {data.get('contact','–')}**\n"
     )
 
+# Пояснение «в чём разница?» — цены и условия подставляются из prices.json
+DIFF_TEMPLATES = {
+    "сад": (
+        "Разница:\n"
+        "• *Общий* — вёрстка одна на всех, ребёнок не на всех фото. Формат 20×30, {kinder_common_short}.\n"
+        "• *Индивидуальный* — персональная вёрстка; {kinder_individual_short}.\n"
+        "_Условия: от {min_albums} альбомов и съёмка {deadline}._"
+    ),
+    "школ": (
+        "Разница:\n"
+        "• *Общий* — {school_common_short}.\n"
+        "• *Индивидуальный* — {school_individual_short}.\n"
+        "_Условия: от {min_albums} альбомов и съёмка {deadline}._"
+    ),
+}
+
 def explain_diff(level: str | None) -> str:
     lvl = (level or "").lower()
-    if "сад" in lvl:
-        return (
-            "Разница:\n"
-            "• *Общий* — вёрстка одна на всех, ребёнок не на всех фото. Формат 20×30, 20 стр. — **3500 ₽**.\n"
-            "• *Индивидуальный* — персональная вёрстка; Мини **2700 ₽**, Лайт **3700 ₽**, Макси **4600 ₽**.\n"
-            "_Условия: от 15 альбомов и съёмка до марта._"
-        )
-    if "школ" in lvl:
-        return (
-            "Разница:\n"
-            "• *Общий* — «Классный» **2200 ₽**, «Дружный» **3200 ₽**, «Большой» **4400 ₽**.\n"
-            "• *Индивидуальный* — «Планшет» **2000 ₽**, «Мини» **3300 ₽**, «Макси» **4100 ₽**.\n"
-            "_Условия: от 15 альбомов и съёмка до марта._"
-        )
+    diffs = price_catalog.render_all("diff", DIFF_TEMPLATES)
+    for marker, text in diffs.items():
+        if marker in lvl:
+            return text
     # если уровень неизвестен — попросим выбрать
     return (
         "Для точной разницы подскажите, это для *детского сада* или *школы*? "
@@ -268,14 +268,16 @@ async def send(cb: CallbackQuery, state: FSMContext):
     save_lead(row)
 
     # Notify owner
-    if OWNER_ID:
+    owner_id = tenants.current().owner_id
+    if owner_id:
         owner_text = (
             "🆕 *Новая заявка (опрос)*\n"
             f"{summary_text(data)}\n"
             f"От: @{user.username or '—'} (id {user.id})"
         )
         try:
-            await cb.message.bot.send_message(OWNER_ID, owner_text, parse_mode="Markdown")
+            with send_priority(Priority.NOTIFY):
+                await cb.message.bot.send_message(owner_id, owner_text, parse_mode="Markdown")
         except Exception:
             pass
 
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Рассылка владельца по всем, кто писал боту (sessions текущего тенанта).
+— Пользователи перебираются потоково из memory_store, профили читаются по одному.
+— Фильтры по профилю: level, org_number, album_type.
+— Отправка с ограниченной параллельностью через очередь send_queue (полоса BULK).
+— Прогресс пишется в <каталог тенанта>/broadcasts/<id>.log — прерванную рассылку можно продолжить.
+  В чекпоинт попадают только отправленные и заблокировавшие бота: ошибки повторяются при /broadcast_resume.
+— Текст уходит как есть (без Markdown): звёздочка или подчёркивание владельца не ломают отправку.
+
+Команды (только для OWNER_ID текущего тенанта):
+    /broadcast level=сад album_type=общий
+    Текст сообщения со второй строки.
+    /broadcast_resume — продолжить последнюю незавершённую рассылку
+    /broadcast_status — прогресс текущей рассылки
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from aiogram import Bot, Router
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.filters import Command
+from aiogram.types import Message
+from loguru import logger
+
+import tenants
+from envcfg import env_num
+from knowledge_base import normalize
+from memory_store import get_profile, iter_user_ids
+from send_queue import Priority, send_priority
+
+router = Router()
+router.message.filter(tenants.is_owner)
+
+FILTER_FIELDS = ("level", "org_number", "album_type")
+CONCURRENCY = max(env_num("BROADCAST_CONCURRENCY", 20), 1)
+
+def _broadcast_dir() -> Path:
+    return tenants.current().data_dir / "broadcasts"
+
+# ---------- ФИЛЬТРЫ ----------
+
+def parse_command(text: str) -> tuple[Dict[str, str], str]:
+    """'/broadcast level=сад\\nТекст' -> ({'level': 'сад'}, 'Текст')."""
+    head, _, body = text.partition("\n")
+    filters: Dict[str, str] = {}
+    for tok in head.split()[1:]:
+        key, sep, value = tok.partition("=")
+        if sep and key in FILTER_FIELDS and value:
+            filters[key] = value
+    return filters, body.strip()
+
+def profile_matches(profile: Dict, filters: Dict[str, str]) -> bool:
+    for key, want in filters.items():
+        have = normalize(str(profile.get(key, "")))
+        want = normalize(want)
+        if key == "org_number":
+            if have != want:
+                return False
+        elif not have or want not in have:   # «сад» ~ «детский сад», «инд» ~ «индивидуальный»
+            return False
+    return True
+
+# ---------- ЧЕКПОИНТ ----------
+
+@dataclass
+class BroadcastJob:
+    job_id: str
+    text: str
+    filters: Dict[str, str]
+    tenant: str = field(default_factory=lambda: tenants.current().name)
+    base_dir: Path = field(default_factory=_broadcast_dir)
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    skipped: int = 0
+    processed: int = 0          # обработано в этом запуске (для скорости; счётчики выше — с учётом чекпоинта)
+    started: float = field(default_factory=time.monotonic)
+    done: Set[int] = field(default_factory=set)
+    finished: bool = False
+
+    @property
+    def meta_path(self) -> Path:
+        return self.base_dir / f"{self.job_id}.json"
+
+    @property
+    def log_path(self) -> Path:
+        return self.base_dir / f"{self.job_id}.log"
+
+    def save_meta(self) -> None:
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        meta = {"job_id": self.job_id, "text": self.text, "filters": self.filters, "finished": self.finished}
+        self.meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, meta_path: Path) -> "BroadcastJob":
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        job = cls(meta["job_id"], meta["text"], meta.get("filters", {}),
+                  base_dir=meta_path.parent, finished=meta.get("finished", False))
+        if job.log_path.exists():
+            with job.log_path.open(encoding="utf-8") as f:
+                for line in f:
+                    uid, _, status = line.strip().partition(" ")
+                    if status == "sent":
+                        job.sent += 1
+                    elif status == "blocked":
+                        job.blocked += 1
+                    else:   # ошибки (в старых логах) не считаем обработанными — повторим
+                        continue
+                    job.done.add(int(uid))
+        return job
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = self.processed / elapsed
+        if self.finished:
+            state = "завершена"
+        elif _running.get(self.tenant) is self:
+            state = "идёт"
+        else:
+            state = "остановлена — /broadcast_resume повторит ошибки и оставшихся"
+        return (
+            f"📣 Рассылка `{self.job_id}` — {state}\n"
+            f"• Отправлено: **{self.sent}**\n"
+            f"• Заблокировали бота: **{self.blocked}**\n"
+            f"• Ошибки: **{self.failed}**\n"
+            f"• Не подошли под фильтр: {self.skipped}\n"
+            f"• Скорость: {rate:.1f} сообщ./с"
+        )
+
+def last_unfinished() -> Optional[BroadcastJob]:
+    base = _broadcast_dir()
+    if not base.exists():
+        return None
+    for meta_path in sorted(base.glob("*.json"), reverse=True):
+        job = BroadcastJob.load(meta_path)
+        if not job.finished:
+            return job
+    return None
+
+# ---------- ОТПРАВКА ----------
+
+_running: Dict[str, BroadcastJob] = {}   # тенант -> текущая рассылка
+_background: Set[asyncio.Task] = set()   # держим ссылки, чтобы задачи не собрал GC
+
+async def _send_one(bot: Bot, job: BroadcastJob, user_id: int, log) -> None:
+    job.processed += 1
+    try:
+        with send_priority(Priority.BULK):
+            await bot.send_message(user_id, job.text, parse_mode=None)
+        status = "sent"
+        job.sent += 1
+    except TelegramForbiddenError:
+        status = "blocked"
+        job.blocked += 1
+    except TelegramBadRequest as e:   # чат удалён / не найден
+        logger.warning(f"Рассылка {job.job_id}: {user_id} — {e}")
+        status = "failed"
+        job.failed += 1
+    except Exception as e:
+        logger.error(f"Рассылка {job.job_id}: {user_id} — {e}")
+        status = "failed"
+        job.failed += 1
+    if status == "failed":   # не в чекпоинт: /broadcast_resume попробует ещё раз
+        return
+    log.write(f"{user_id} {status}\n")
+    log.flush()
+
+async def run_broadcast(bot: Bot, job: BroadcastJob, *, concurrency: int = CONCURRENCY) -> BroadcastJob:
+    """Разослать job.text всем подходящим пользователям, пропуская уже обработанных."""
+    job.save_meta()
+    owner_id = tenants.current().owner_id
+    sem = asyncio.Semaphore(concurrency)
+    tasks: Set[asyncio.Task] = set()
+
+    async def worker(uid: int) -> None:
+        try:
+            await _send_one(bot, job, uid, log)
+        finally:
+            sem.release()
+
+    with job.log_path.open("a", encoding="utf-8") as log:
+        for uid in iter_user_ids():
+            if uid in job.done or uid == owner_id:
+                continue
+            if job.filters and not profile_matches(get_profile(uid, remember=False), job.filters):
+                job.skipped += 1
+                continue
+            await sem.acquire()   # не больше concurrency отправок одновременно
+            task = asyncio.create_task(worker(uid))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    job.finished = not job.failed   # с ошибками рассылка остаётся незавершённой — их добьёт /broadcast_resume
+    job.save_meta()
+    logger.info(f"Рассылка {job.job_id} {'завершена' if job.finished else 'прошла с ошибками'}: sent={job.sent} blocked={job.blocked} failed={job.failed}")
+    return job
+
+async def _run_and_report(bot: Bot, chat_id: int, job: BroadcastJob) -> None:
+    try:
+        await run_broadcast(bot, job)
+    except Exception as e:
+        logger.error(f"Рассылка {job.job_id} прервана: {e}")
+    finally:
+        _running.pop(job.tenant, None)
+    await bot.send_message(chat_id, job.report())
+
+def _start(bot: Bot, chat_id: int, job: BroadcastJob) -> None:
+    _running[job.tenant] = job
+    # задача наследует contextvar тенанта — сессии и прогресс берутся из его каталога
+    task = asyncio.create_task(_run_and_report(bot, chat_id, job))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+# ---------- КОМАНДЫ ----------
+
+@router.message(Command("broadcast"))
+async def broadcast_cmd(message: Message) -> None:
+    if tenants.current().name in _running:
+        await message.answer("Уже идёт рассылка — /broadcast_status")
+        return
+    filters, text = parse_command(message.text or "")
+    if not text:
+        await message.answer(
+            "Формат:\n`/broadcast level=сад album_type=общий`\nТекст сообщения со второй строки.\n"
+            "Фильтры необязательны: level, org_number, album_type."
+        )
+        return
+    job = BroadcastJob(datetime.now().strftime("%Y%m%d-%H%M%S"), text, filters)
+    await message.answer(f"Запускаю рассылку `{job.job_id}`…")
+    _start(message.bot, message.chat.id, job)
+
+@router.message(Command("broadcast_resume"))
+async def broadcast_resume_cmd(message: Message) -> None:
+    if tenants.current().name in _running:
+        await message.answer("Уже идёт рассылка — /broadcast_status")
+        return
+    job = last_unfinished()
+    if job is None:
+        await message.answer("Незавершённых рассылок нет.")
+        return
+    await message.answer(f"Продолжаю рассылку `{job.job_id}` (уже обработано: {len(job.done)})…")
+    _start(message.bot, message.chat.id, job)
+
+@router.message(Command("broadcast_status"))
+async def broadcast_status_cmd(message: Message) -> None:
+    job = _running.get(tenants.current().name)
+    if job is None:
+        await message.answer("Сейчас рассылок нет.")
+        return
+    await message.answer(job.report())
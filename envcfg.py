@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Чтение настроек из окружения (.env подгружает tenants.py).
+— `env_num("SEND_CHAT_RATE", 1.0)` — число того же типа, что и значение по умолчанию (int или float);
+  пусто — значение по умолчанию, мусор — предупреждение в лог и значение по умолчанию.
+— `env_flag("PROFILE", False)` — 1/true/yes/on или 0/false/no/off; пусто или мусор — значение по умолчанию.
+"""
+from __future__ import annotations
+
+import os
+from typing import TypeVar
+
+from loguru import logger
+
+Num = TypeVar("Num", int, float)
+
+TRUE = frozenset({"1", "true", "yes", "on"})
+FALSE = frozenset({"0", "false", "no", "off"})
+
+def env_num(name: str, default: Num) -> Num:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return type(default)(raw)
+    except ValueError:
+        logger.warning(f"{name}={raw!r} — не число, берём {default}")
+        return default
+
+def env_flag(name: str, default: bool) -> bool:
+    raw = os.getenv(name, "").strip().lower()
+    if raw in TRUE:
+        return True
+    if raw in FALSE:
+        return False
+    if raw:
+        logger.warning(f"{name}={raw!r} — ожидается 1/0, true/false, yes/no или on/off; берём {int(default)}")
+    return default
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Бюджет времени на ответ GPT и предохранитель (circuit breaker).
+— Каждому запросу — бюджет GPT_REPLY_BUDGET секунд. Не уложился — пользователь сразу получает подсказки FAQ
+  (или меню), а ответ GPT, если всё же придёт за GPT_FOLLOWUP_TIMEOUT, досылается отдельным сообщением.
+— GPT_BREAKER_FAILS медленных или неудачных вызовов подряд размыкают предохранитель: GPT пропускается,
+  пока фоновая проверка здоровья (лёгкий запрос к API раз в GPT_BREAKER_PROBE с) не пройдёт.
+— Метрики: вызовы, ответы в бюджете, промахи бюджета, ошибки, пропуски, досылки, задержки,
+  состояние предохранителя — `stats()`, команда администратора /gpt_stats и лог на остановке.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+from envcfg import env_flag, env_num
+
+# ---------- ПРЕДОХРАНИТЕЛЬ ----------
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"       # GPT работает
+    OPEN = "open"           # GPT пропускаем, ждём проверки здоровья
+    PROBING = "probing"     # идёт проверка здоровья
+
+class CircuitBreaker:
+    def __init__(self, *, fails: int = 3, probe_interval: float = 30.0,
+                 probe: Optional[Callable[[], Awaitable[bool]]] = None) -> None:
+        self.fails = fails
+        self.probe_interval = probe_interval
+        self.probe = probe
+        self.state = BreakerState.CLOSED
+        self.consecutive = 0        # медленных/неудачных вызовов подряд
+        self.trips = 0
+        self.probes = 0
+        self.opened_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def allow(self) -> bool:
+        return self.state is BreakerState.CLOSED
+
+    def record(self, ok: bool) -> None:
+        if ok:
+            self.consecutive = 0
+            return
+        self.consecutive += 1
+        if self.state is BreakerState.CLOSED and self.consecutive >= self.fails:
+            self.trip()
+
+    def trip(self) -> None:
+        self.state = BreakerState.OPEN
+        self.trips += 1
+        self.opened_at = time.monotonic()
+        logger.warning(f"GPT: предохранитель разомкнут после {self.consecutive} медленных/неудачных вызовов подряд")
+        if self.probe is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._probe_loop(), name="gpt-health-probe")
+
+    def reset(self) -> None:
+        was_open = self.state is not BreakerState.CLOSED
+        self.state = BreakerState.CLOSED
+        self.consecutive = 0
+        if was_open:
+            logger.info(f"GPT: проверка здоровья прошла, предохранитель замкнут (был разомкнут {time.monotonic() - self.opened_at:.0f} с)")
+
+    async def _probe_loop(self) -> None:
+        while self.state is not BreakerState.CLOSED:
+            await asyncio.sleep(self.probe_interval)
+            self.state = BreakerState.PROBING
+            self.probes += 1
+            try:
+                ok = await self.probe()
+            except Exception as e:
+                logger.warning(f"GPT: проверка здоровья не прошла: {e}")
+                ok = False
+            if ok:
+                self.reset()
+            else:
+                self.state = BreakerState.OPEN
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# ---------- БЮДЖЕТ НА ОТВЕТ ----------
+
+@dataclass
+class GptStats:
+    calls: int = 0              # запросов, дошедших до GPT
+    in_budget: int = 0          # ответ уложился в бюджет
+    deadline_misses: int = 0    # бюджет исчерпан — ушёл быстрый фолбэк
+    errors: int = 0             # ошибка или пустой ответ в пределах бюджета
+    skipped: int = 0            # предохранитель разомкнут — GPT не вызывали
+    followups: int = 0          # поздний ответ дослан
+    followups_lost: int = 0     # поздний ответ так и не пришёл
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    started: float = field(default_factory=time.monotonic)
+
+    def as_dict(self) -> Dict[str, float]:
+        done = self.in_budget + self.errors
+        return {
+            "calls": self.calls,
+            "in_budget": self.in_budget,
+            "deadline_misses": self.deadline_misses,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "followups": self.followups,
+            "followups_lost": self.followups_lost,
+            "latency_avg": round(self.latency_total / done, 2) if done else 0.0,
+            "latency_max": round(self.latency_max, 2),
+        }
+
+@dataclass
+class Outcome:
+    answer: Optional[str]                   # ответ GPT в пределах бюджета
+    status: str                             # ok | timeout | error | skipped | disabled
+    pending: Optional[asyncio.Task] = None  # запрос, который ещё может ответить (для досылки)
+
+class ReplyDeadline:
+    """
+    Обёртка над ask_gpt:
+        outcome = await gate.ask(user_id, text)
+        if outcome.answer: ... else: фолбэк; gate.follow_up(outcome, send)
+    """
+
+    def __init__(
+        self,
+        ask: Callable[[int, str], Awaitable[Optional[str]]],
+        *,
+        budget: float = 8.0,
+        followup: bool = True,
+        followup_timeout: float = 60.0,
+        breaker: Optional[CircuitBreaker] = None,
+        enabled: Callable[[], bool] = lambda: True,
+    ) -> None:
+        self.ask_fn = ask
+        self.budget = budget
+        self.followup = followup
+        self.followup_timeout = followup_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.enabled = enabled
+        self.stats = GptStats()
+        self._background: set[asyncio.Task] = set()
+
+    def available(self) -> bool:
+        return self.enabled() and self.breaker.allow()
+
+    async def ask(self, user_id: int, text: str) -> Outcome:
+        if not self.enabled():
+            return Outcome(None, "disabled")
+        if not self.breaker.allow():
+            self.stats.skipped += 1
+            return Outcome(None, "skipped")
+
+        self.stats.calls += 1
+        t0 = time.monotonic()
+        task = asyncio.create_task(self.ask_fn(user_id, text))
+        done, _ = await asyncio.wait({task}, timeout=self.budget)
+        if not done:
+            self.stats.deadline_misses += 1
+            self.breaker.record(False)
+            logger.warning(f"GPT не уложился в {self.budget:g} с — отвечаем фолбэком (user {user_id})")
+            if not self.followup:
+                task.cancel()
+                return Outcome(None, "timeout")
+            return Outcome(None, "timeout", task)
+
+        elapsed = time.monotonic() - t0
+        self.stats.latency_total += elapsed
+        self.stats.latency_max = max(self.stats.latency_max, elapsed)
+        answer = None if task.cancelled() or task.exception() else task.result()
+        if not answer:
+            self.stats.errors += 1
+            self.breaker.record(False)
+            return Outcome(None, "error")
+        self.stats.in_budget += 1
+        self.breaker.record(True)
+        return Outcome(answer, "ok")
+
+    def follow_up(self, outcome: Outcome, send: Callable[[str], Awaitable[object]]) -> None:
+        """Дослать поздний ответ GPT, если он придёт до followup_timeout (в фоне, не блокируя хендлер)."""
+        if outcome.pending is None:
+            return
+        task = asyncio.create_task(self._deliver(outcome.pending, send))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _deliver(self, pending: asyncio.Task, send: Callable[[str], Awaitable[object]]) -> None:
+        try:
+            answer = await asyncio.wait_for(pending, timeout=max(self.followup_timeout - self.budget, 0.0))
+        except Exception:   # таймаут (wait_for отменит запрос) или ошибка GPT
+            answer = None
+        if not answer:
+            self.stats.followups_lost += 1
+            return
+        try:
+            await send(answer)
+            self.stats.followups += 1
+        except Exception as e:
+            self.stats.followups_lost += 1
+            logger.error(f"GPT: не удалось дослать поздний ответ: {e}")
+
+    def status(self) -> str:
+        s = self.stats.as_dict()
+        b = self.breaker
+        return (
+            f"GPT: бюджет {self.budget:g} с, досылка {'вкл' if self.followup else 'выкл'}\n"
+            f"• вызовов {s['calls']}: в бюджете {s['in_budget']}, промахов бюджета {s['deadline_misses']}, ошибок {s['errors']}\n"
+            f"• пропущено (предохранитель) {s['skipped']}, дослано {s['followups']}, не дошло {s['followups_lost']}\n"
+            f"• задержка ср. {s['latency_avg']} с, макс. {s['latency_max']} с\n"
+            f"• предохранитель: {b.state.value}, подряд неудач {b.consecutive}/{b.fails}, "
+            f"срабатываний {b.trips}, проверок здоровья {b.probes}"
+        )
+
+    def metrics(self) -> Dict[str, object]:
+        b = self.breaker
+        return {**self.stats.as_dict(), "breaker": b.state.value, "breaker_trips": b.trips, "breaker_probes": b.probes}
+
+    async def close(self) -> None:
+        await self.breaker.stop()
+        for task in list(self._background):
+            task.cancel()
+        logger.info(f"GPT: {self.metrics()}")
+
+def from_env(ask: Callable[[int, str], Awaitable[Optional[str]]], *,
+             probe: Optional[Callable[[], Awaitable[bool]]] = None,
+             enabled: Callable[[], bool] = lambda: True) -> ReplyDeadline:
+    return ReplyDeadline(
+        ask,
+        budget=env_num("GPT_REPLY_BUDGET", 8.0),
+        followup=env_flag("GPT_FOLLOWUP", True),
+        followup_timeout=env_num("GPT_FOLLOWUP_TIMEOUT", 60.0),
+        breaker=CircuitBreaker(
+            fails=env_num("GPT_BREAKER_FAILS", 3),
+            probe_interval=env_num("GPT_BREAKER_PROBE", 30.0),
+            probe=probe,
+        ),
+        enabled=enabled,
+    )
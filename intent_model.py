@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Второй уровень после FAQ: линейный классификатор намерений на хэшированных символьных n-граммах.
+— Ловит запросы между уверенным ответом FAQ и явным промахом — раньше они уходили в GPT
+  или получали расплывчатую клавиатуру подсказок.
+— Признаки: n-граммы символов нормализованного текста (crc32 → DIM корзин), вектор нормирован по L2.
+— Модель: softmax-регрессия, обучается офлайн (train_intents.py, нужен numpy) на триггерах INTENTS,
+  размеченном корпусе intent_corpus.jsonl и запросах из logs/dialog_log.txt; вероятности откалиброваны
+  температурой на отложенной выборке, порог уверенности подобран там же.
+— Артефакт intent_model.bin: MAGIC | длина заголовка | заголовок (json: версия, метки, порог, метрики)
+  | веса float32 DIM×K | смещения float32 K. Без артефакта бот работает как раньше.
+— Инференс — десятки микросекунд: с numpy векторно, без numpy — на array.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from envcfg import env_flag, env_num
+from knowledge_base import normalize
+
+@lru_cache(maxsize=1)
+def _numpy():
+    """numpy — необязательная зависимость (обязательна только для обучения).
+    Импортируется при загрузке модели, а не при импорте модуля — не утяжеляем старт бота."""
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        return None
+    return numpy
+
+OTHER = "другое"   # метка «не про FAQ» — такие запросы идут дальше, в GPT
+MAGIC = b"CWI\x01"
+FORMAT = 1
+_LEN = struct.Struct("<I")
+
+MODEL_PATH = Path(os.getenv("INTENT_MODEL", "") or Path(__file__).parent / "intent_model.bin")
+ENABLED = env_flag("INTENT_CLASSIFIER", True)
+MIN_PROB = env_num("INTENT_MIN_PROB", 0.0)   # 0 — порог из артефакта
+
+# ---------- ПРИЗНАКИ ----------
+
+def features(text: str, dim: int, ngram: Tuple[int, int] = (2, 4)) -> Dict[int, float]:
+    """Хэшированные n-граммы символов: {корзина: вес}, L2-норма = 1. dim — степень двойки."""
+    t = f" {normalize(text)} "
+    counts: Dict[int, float] = {}
+    lo, hi = ngram
+    for n in range(lo, hi + 1):
+        for i in range(len(t) - n + 1):
+            h = zlib.crc32(t[i:i + n].encode("utf-8")) & (dim - 1)
+            counts[h] = counts.get(h, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+# ---------- АРТЕФАКТ ----------
+
+def encode(header: Dict[str, Any], weights: bytes, bias: bytes) -> bytes:
+    """Собрать intent_model.bin: веса и смещения — float32 little-endian."""
+    head = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"".join((MAGIC, _LEN.pack(len(head)), head, weights, bias))
+
+def _floats(raw: bytes, np):
+    if np is not None:
+        return np.frombuffer(raw, dtype="<f4")
+    arr = array("f", raw)
+    if sys.byteorder == "big":  # pragma: no cover
+        arr.byteswap()
+    return arr
+
+@dataclass(frozen=True)
+class Prediction:
+    intent: str
+    prob: float      # откалиброванная вероятность
+
+class IntentModel:
+    def __init__(self, header: Dict[str, Any], weights: bytes, bias: bytes) -> None:
+        self.header = header
+        self.labels: List[str] = header["labels"]
+        self.dim: int = header["dim"]
+        self.ngram: Tuple[int, int] = tuple(header["ngram"])
+        self.temperature: float = header.get("temperature", 1.0)
+        self.threshold: float = header.get("threshold", 0.5)
+        self.version: str = header.get("version", "?")
+        k = len(self.labels)
+        if len(weights) != 4 * self.dim * k or len(bias) != 4 * k:
+            raise ValueError("размер весов не совпадает с заголовком")
+        self._np = _numpy()
+        self._w = _floats(weights, self._np)
+        self._b = _floats(bias, self._np)
+        if self._np is not None:
+            self._w = self._w.reshape(self.dim, k)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "IntentModel":
+        if not data.startswith(MAGIC):
+            raise ValueError("не артефакт классификатора")
+        pos = len(MAGIC)
+        (n,) = _LEN.unpack_from(data, pos)
+        pos += _LEN.size
+        header = json.loads(data[pos:pos + n].decode("utf-8"))
+        if header.get("format") != FORMAT:
+            raise ValueError(f"формат {header.get('format')} не поддерживается")
+        pos += n
+        k = len(header["labels"])
+        split = pos + 4 * header["dim"] * k
+        return cls(header, data[pos:split], data[split:])
+
+    @classmethod
+    def load(cls, path: Path) -> "IntentModel":
+        return cls.from_bytes(path.read_bytes())
+
+    def logits(self, text: str) -> List[float]:
+        feats = features(text, self.dim, self.ngram)
+        np = self._np
+        if np is not None:
+            if not feats:
+                return list(self._b)
+            idx = np.fromiter(feats.keys(), dtype=np.intp, count=len(feats))
+            vals = np.fromiter(feats.values(), dtype=np.float32, count=len(feats))
+            return (vals @ self._w[idx] + self._b).tolist()
+        k = len(self.labels)
+        z = list(self._b)
+        w = self._w
+        for idx, val in feats.items():
+            base = idx * k
+            for j in range(k):
+                z[j] += w[base + j] * val
+        return z
+
+    def proba(self, text: str) -> List[float]:
+        z = [v / self.temperature for v in self.logits(text)]
+        top = max(z)
+        e = [math.exp(v - top) for v in z]
+        s = sum(e)
+        return [v / s for v in e]
+
+    def predict(self, text: str) -> Prediction:
+        p = self.proba(text)
+        j = max(range(len(p)), key=p.__getitem__)
+        return Prediction(self.labels[j], p[j])
+
+# ---------- ЗАГРУЗКА / ИНФЕРЕНС ----------
+
+_model: Optional[IntentModel] = None
+_tried = False
+
+def load(path: Path = MODEL_PATH) -> Optional[IntentModel]:
+    """Загрузить артефакт (вызывается на старте; при ошибке классификатор просто выключен)."""
+    global _model, _tried
+    _tried = True
+    if not ENABLED or not path.exists():
+        _model = None
+        return None
+    try:
+        _model = IntentModel.load(path)
+    except Exception as e:
+        logger.warning(f"Классификатор намерений не загружен ({path.name}): {e}")
+        _model = None
+        return None
+    logger.info(f"Классификатор намерений {_model.version}: {len(_model.labels)} меток, порог {_model.threshold:.2f}")
+    return _model
+
+def model() -> Optional[IntentModel]:
+    if not _tried:
+        load()
+    return _model
+
+def classify(text: str) -> Optional[Prediction]:
+    """Намерение FAQ, если модель в нём уверена; иначе None (запрос идёт дальше — подсказки/GPT)."""
+    m = model()
+    if m is None:
+        return None
+    pred = m.predict(text)
+    if pred.intent == OTHER or pred.prob < (MIN_PROB or m.threshold):
+        return None
+    return pred
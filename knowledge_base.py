@@ -14,6 +14,8 @@ from difflib import SequenceMatcher
 import re
 from typing import List, Tuple, Dict, Optional
 
+import price_catalog
+
 # ---------- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ----------
 
 _PUNCT_RE = re.compile(r"[^\w\s]+", re.U)
@@ -35,62 +37,60 @@ def sim(a: str, b: str) -> float:
 class Intent:
     key: str                    # Человекочитаемое имя намерения
     triggers: Tuple[str, ...]   # Синонимы/фразы-триггеры
-    answer: str                 # Готовый ответ (Markdown/Telegram)
 
-# Тексты ответов
-ANSWERS = {
+    @property
+    def answer(self) -> str:
+        """Готовый ответ (Markdown/Telegram) с актуальными ценами."""
+        return answers()[self.key]
+
+# Шаблоны ответов: цены и условия подставляются из prices.json (см. price_catalog)
+ANSWER_TEMPLATES = {
     "общий_сад": (
         "📘 **Общий альбом «Про меня и нашу группу»**\n"
         "Вёрстка — одна на всех, персональный только первый разворот. "
         "Портрет на обложке — бесплатно. В альбомах одинаковые групповые кадры — "
         "ваш ребёнок не на всех фото. Нежная ретушь включена. Формат — 20×30, единый дизайн.\n\n"
-        "💰 20 стр. (10 разворотов) — **3500 ₽**, 2 съёмки, 2–3 локации.\n"
-        "Цены при заказе от 15 альбомов (≥85% группы) и съёмке **до марта**.\n"
-        "Дубликат — за 50%. Фото из альбома в электронном виде — бесплатно."
+        "{kinder_common}.\n"
+        "Цены при заказе от {min_albums} альбомов (≥{min_share} группы) и съёмке **{deadline}**.\n"
+        "Дубликат — за {duplicate}. Фото из альбома в электронном виде — бесплатно."
     ),
     "индив_сад": (
         "📗 **Индивидуальный альбом (детский сад)** — главный герой ваш ребёнок.\n"
         "Персональная вёрстка: фото ребёнка один, с друзьями, воспитателями.\n"
         "Нежная ретушь включена. Формат — 20×20 или 20×30; можно 2 дизайна (мальчики/девочки).\n\n"
-        "💰 Мини (4 стр., 2 разворота) — **2700 ₽**\n"
-        "💰 Лайт (8 стр., 4 разворота) — **3700 ₽**\n"
-        "💰 Макси (12 стр., 6 разворотов) — **4600 ₽**\n"
-        "Цены при заказе от 15 альбомов (≥85% группы) и съёмке **до марта**.\n"
-        "Дубликат — за 50%. Фото из альбома в электронном виде — бесплатно."
+        "{kinder_individual}\n"
+        "Цены при заказе от {min_albums} альбомов (≥{min_share} группы) и съёмке **{deadline}**.\n"
+        "Дубликат — за {duplicate}. Фото из альбома в электронном виде — бесплатно."
     ),
     "индив_школа": (
         "📗 **Индивидуальный школьный альбом** — главный герой ваш ребёнок.\n"
         "Персональная вёрстка: фото ребёнка один, с друзьями, с учителем. "
         "Нежная ретушь включена. Формат — 20×20 или 20×30.\n\n"
-        "💰 Планшет (2 стр., 1 разворот) — **2000 ₽**\n"
-        "💰 Мини (6 стр., 3 разворота) — **3300 ₽**\n"
-        "💰 Макси (10 стр., 5 разворотов) — **4100 ₽**\n"
-        "Цены при заказе от 15 альбомов (≥85% класса) и съёмке **до марта**.\n"
-        "Дубликат — за 50%. Фото из альбома в электронном виде — бесплатно."
+        "{school_individual}\n"
+        "Цены при заказе от {min_albums} альбомов (≥{min_share} класса) и съёмке **{deadline}**.\n"
+        "Дубликат — за {duplicate}. Фото из альбома в электронном виде — бесплатно."
     ),
     "общий_школа": (
         "📘 **Общий школьный альбом «Про меня и наш класс»**\n"
         "Вёрстка — одна на всех, персональный только первый разворот. "
         "Портрет на обложке — бесплатно. Съёмка — одинаковые групповые кадры, "
         "ребёнок не на всех фото.\n\n"
-        "💰 Классный (4 стр., 2 разворота) — **2200 ₽**\n"
-        "💰 Дружный (10 стр., 5 разворотов) — **3200 ₽**\n"
-        "💰 Большой (20–30 стр., 10–15 разворотов) — **4400 ₽**\n"
-        "Цены при заказе от 15 альбомов (≥85% класса) и съёмке **до марта**.\n"
-        "Дубликат — за 50%. Фото из альбома в электронном виде — бесплатно."
+        "{school_common}\n"
+        "Цены при заказе от {min_albums} альбомов (≥{min_share} класса) и съёмке **{deadline}**.\n"
+        "Дубликат — за {duplicate}. Фото из альбома в электронном виде — бесплатно."
     ),
     "условия": (
         "📌 **Условия заказа**\n"
-        "Цены действительны при заказе от **15 альбомов** и ≥**85%** группы/класса. "
-        "Все съёмки должны пройти **до марта**. Возможна съёмка в нескольких локациях."
+        "Цены действительны при заказе от **{min_albums} альбомов** и ≥**{min_share}** группы/класса. "
+        "Все съёмки должны пройти **{deadline}**. Возможна съёмка в нескольких локациях."
     ),
     "доп_разворот": (
         "➕ **Дополнительные развороты**\n"
-        "• Общий разворот — **+400 ₽** (группа/класс на фото, ребёнок не на всех кадрах)\n"
-        "• Индивидуальный разворот — **+600 ₽** (ваш ребёнок на всех фото)"
+        "• Общий разворот — **+{extra_common}** (группа/класс на фото, ребёнок не на всех кадрах)\n"
+        "• Индивидуальный разворот — **+{extra_individual}** (ваш ребёнок на всех фото)"
     ),
     "дубликат": (
-        "📚 **Дубликат альбома** — за **50%** от стоимости основного. "
+        "📚 **Дубликат альбома** — за **{duplicate}** от стоимости основного. "
         "Отличный подарок бабушкам и дедушкам."
     ),
     "печать": (
@@ -109,63 +109,59 @@ ANSWERS = {
     ),
 }
 
+def answers() -> Dict[str, str]:
+    """Готовые тексты ответов для текущей версии каталога цен (рендер кэшируется).
+    Тенант может переопределить отдельные ответы (контакты и т.п.) в разделе "answers" своего prices.json."""
+    overrides = price_catalog.catalog().get("answers")
+    return price_catalog.render_all("faq", {**ANSWER_TEMPLATES, **overrides} if overrides else ANSWER_TEMPLATES)
+
 INTENTS: Tuple[Intent, ...] = (
     Intent(
         key="общий_сад",
         triggers=("общий альбом сад","про группу","про нас","альбом на всех","общий сад","общая вёрстка сад"),
-        answer=ANSWERS["общий_сад"],
     ),
     Intent(
         key="индив_сад",
         triggers=("индивидуальный альбом сад","персональный альбом сад","индивидуалка сад","свой альбом сад"),
-        answer=ANSWERS["индив_сад"],
     ),
     Intent(
         key="индив_школа",
         triggers=("индивидуальный альбом школа","персональный альбом школа","свой альбом школа"),
-        answer=ANSWERS["индив_школа"],
     ),
     Intent(
         key="общий_школа",
         triggers=("общий альбом школа","про класс","наш класс","общий школа","весь класс","общая вёрстка школа"),
-        answer=ANSWERS["общий_школа"],
     ),
     Intent(
         key="условия",
         triggers=("условия заказа","минимум альбомов","сроки заказа"),
-        answer=ANSWERS["условия"],
     ),
     Intent(
         key="доп_разворот",
         triggers=("дополнительный разворот","доп разворот","extra page","extra разворот"),
-        answer=ANSWERS["доп_разворот"],
     ),
     Intent(
         key="дубликат",
         triggers=("дубликат","копия альбома","второй альбом","альбом для бабушки"),
-        answer=ANSWERS["дубликат"],
     ),
     Intent(
         key="печать",
         triggers=("печать","бумага","типография","качество печати"),
-        answer=ANSWERS["печать"],
     ),
     Intent(
         key="доставка",
         triggers=("доставка","получение","как получить","когда отдадут"),
-        answer=ANSWERS["доставка"],
     ),
     Intent(
         key="контакты",
         triggers=("контакты","связаться","куда писать","телефон","почта"),
-        answer=ANSWERS["контакты"],
     ),
 )
 
-# Предрасчёт нормализованных триггеров (ускорение)
-NORM_TRIGGERS: Dict[str, List[str]] = {
-    intent.key: [normalize(t) for t in intent.triggers] for intent in INTENTS
-}
+# Предрасчёт нормализованных триггеров (ускорение): считается один раз при первом поиске
+@lru_cache(maxsize=1)
+def norm_triggers() -> Dict[str, List[str]]:
+    return {intent.key: [normalize(t) for t in intent.triggers] for intent in INTENTS}
 
 # ---------- ПОИСК ----------
 
@@ -176,21 +172,26 @@ class MatchResult:
     confidence: float
     suggestions: Tuple[str, ...] = ()
 
-@lru_cache(maxsize=2048)
 def get_faq_answer(user_query: str, *, threshold: float = 0.58) -> MatchResult:
     """
     Возвращает лучший ответ по смысловому совпадению.
     Если уверенность ниже порога — вернёт подсказки (suggestions) и пустой answer.
     """
+    return _get_faq_answer(user_query, threshold, price_catalog.version())
+
+@lru_cache(maxsize=2048)
+def _get_faq_answer(user_query: str, threshold: float, catalog_version: str) -> MatchResult:
+    # catalog_version — часть ключа кэша: после смены цен старые ответы не отдаются
     qn = normalize(user_query)
     if not qn:
         return MatchResult(None, None, 0.0, ())
+    triggers = norm_triggers()
 
     best_key = None
     best_score = 0.0
 
     # 1) Точное вхождение любого нормализованного триггера — высокий балл
-    for key, trig_list in NORM_TRIGGERS.items():
+    for key, trig_list in triggers.items():
         for trig in trig_list:
             if trig and trig in qn:
                 score = 0.95 * (len(trig) / (len(qn) + 1e-9)) ** 0.25
@@ -199,7 +200,7 @@ def get_faq_answer(user_query: str, *, threshold: float = 0.58) -> MatchResult:
                     best_key = key
 
     # 2) Fuzzy-склонение по всем триггерам (difflib)
-    for key, trig_list in NORM_TRIGGERS.items():
+    for key, trig_list in triggers.items():
         for trig in trig_list:
             if not trig:
                 continue
@@ -213,7 +214,7 @@ def get_faq_answer(user_query: str, *, threshold: float = 0.58) -> MatchResult:
 
     if best_key and best_score >= threshold:
         return MatchResult(
-            ANSWERS[best_key],
+            answers()[best_key],
             best_key,
             round(best_score, 3),
             ()
@@ -221,7 +222,7 @@ def get_faq_answer(user_query: str, *, threshold: float = 0.58) -> MatchResult:
 
     # Сформируем 3 подсказки по наиболее близким намерениям
     scored = []
-    for key, trig_list in NORM_TRIGGERS.items():
+    for key, trig_list in triggers.items():
         local = max((sim(trig, qn) for trig in trig_list), default=0.0)
         scored.append((local, key))
     scored.sort(reverse=True)
@@ -233,6 +234,9 @@ def get_faq_answer(user_query: str, *, threshold: float = 0.58) -> MatchResult:
 
 def build_faq_knowledge() -> str:
     """Строка вида: 'Вопрос: <синонимы>\\nОтвет: <текст>' — удобно отдавать LLM."""
+    return price_catalog.derived("faq_knowledge", _build_faq_knowledge)
+
+def _build_faq_knowledge() -> str:
     parts = []
     for intent in INTENTS:
         parts.append(
@@ -241,15 +245,20 @@ def build_faq_knowledge() -> str:
         )
     return "\n\n".join(parts)
 
-faq_knowledge = build_faq_knowledge()
-
-# Backward compatibility alias
-FAQ = faq_knowledge
+def __getattr__(name: str):
+    # Ленивые алиасы для старого кода: faq_knowledge / FAQ / NORM_TRIGGERS / ANSWERS
+    if name == "ANSWERS":
+        return answers()
+    if name in ("faq_knowledge", "FAQ"):
+        return build_faq_knowledge()
+    if name == "NORM_TRIGGERS":
+        return norm_triggers()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ---------- TODO (опционально) ----------
 # 1) Установите 'rapidfuzz' и замените difflib на быстрые метрики:
 #    from rapidfuzz import fuzz
 #    def sim(a,b): return fuzz.token_set_ratio(a,b) / 100
 # 2) Для русского лучше использовать лемматизацию (pymorphy2) и токен-оверлап.
-# 3) Вынести цены/пороговые условия в JSON и подставлять динамически (например, «до марта»).
+# 3) Сделано: цены/условия в prices.json, тексты рендерятся из шаблонов (price_catalog).
 # 4) Добавить трекинг неузнанных вопросов в лог, чтобы расширять базу.
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Инкрементальная аналитика по заявкам (leads.csv тенанта) для владельца.
+— Снапшот агрегатов хранится в <каталог тенанта>/lead_stats.json вместе с байтовым смещением в leads.csv.
+— При запросе дочитываются только новые строки: стоимость O(новых заявок), а не O(всех).
+— Если файл обрезали/пересоздали (другой inode или начало файла) или формат снапшота сменился — пересчёт с нуля.
+— Строки разбираются так же, как их пишет booking_router.save_lead: запятые без CSV-кавычек.
+
+Команды (только для OWNER_ID текущего тенанта):
+    /leads — сводка (сад/школа, учреждения, тип альбома, дети, последние дни)
+    /leads_export csv|json — выгрузка агрегатов файлом
+    /leads_rebuild — пересчитать снапшот с нуля
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
+from loguru import logger
+
+import tenants
+from booking_router import _lead_path
+
+router = Router()
+router.message.filter(tenants.is_owner)
+
+SNAPSHOT_NAME = "lead_stats.json"
+SNAPSHOT_VERSION = 2
+HEAD_BYTES = 512   # столько байт начала leads.csv (заголовок + первые заявки) идёт в отпечаток файла
+
+DIMENSIONS = ("by_level", "by_org", "by_album", "by_day")
+
+# Колонки leads.csv (см. booking_router.save_lead)
+COL_TS, COL_LEVEL, COL_ORG, COL_ALBUM, COL_COUNT = 0, 2, 3, 4, 5
+
+def _snapshot_path() -> Path:
+    return tenants.current().data_dir / SNAPSHOT_NAME
+
+def _empty() -> Dict:
+    snap = {"version": SNAPSHOT_VERSION, "offset": 0, "inode": 0, "head": "", "leads": 0, "children": 0}
+    for dim in DIMENSIONS:
+        snap[dim] = {}
+    return snap
+
+def _load_snapshot() -> Dict:
+    path = _snapshot_path()
+    if path.exists():
+        try:
+            snap = json.loads(path.read_text(encoding="utf-8"))
+            if snap.get("version") == SNAPSHOT_VERSION:
+                return snap
+        except Exception:
+            pass
+    return _empty()
+
+def _save_snapshot(snap: Dict) -> None:
+    path = _snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(snap, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(path)
+
+def _bump(bucket: Dict, key: str, children: int) -> None:
+    cell = bucket.setdefault(key or "–", {"leads": 0, "children": 0})
+    cell["leads"] += 1
+    cell["children"] += children
+
+def _head(f, size: int) -> str:
+    """Отпечаток начала файла: пересозданный leads.csv с тем же заголовком отличается первыми заявками."""
+    f.seek(0)
+    return hashlib.sha1(f.read(min(size, HEAD_BYTES))).hexdigest()
+
+def _apply_row(snap: Dict, row: List[str]) -> None:
+    if len(row) <= COL_COUNT or row[COL_TS] == "ts":   # заголовок или битая строка
+        return
+    level, org, album = row[COL_LEVEL].strip(), row[COL_ORG].strip(), row[COL_ALBUM].strip()
+    children = int(row[COL_COUNT]) if row[COL_COUNT].strip().isdigit() else 0
+    snap["leads"] += 1
+    snap["children"] += children
+    _bump(snap["by_level"], level, children)
+    _bump(snap["by_org"], f"{level} №{org}" if org else level, children)
+    _bump(snap["by_album"], album, children)
+    _bump(snap["by_day"], row[COL_TS][:10], children)
+
+def refresh(*, rebuild: bool = False) -> Dict:
+    """Дочитать новые строки leads.csv с сохранённого смещения и обновить снапшот."""
+    snap = _empty() if rebuild else _load_snapshot()
+    path = _lead_path()
+    if not path.exists():
+        return snap
+    with path.open("rb") as f:
+        st = os.fstat(f.fileno())
+        if snap["offset"] and (st.st_size < snap["offset"] or st.st_ino != snap["inode"]
+                               or _head(f, snap["offset"]) != snap["head"]):
+            logger.warning("leads.csv обрезан или пересоздан — пересчитываю статистику с нуля")
+            snap = _empty()
+        if st.st_size == snap["offset"] and not rebuild:
+            return snap
+
+        f.seek(snap["offset"])
+        chunk = f.read()
+        end = chunk.rfind(b"\n") + 1   # недописанную последнюю строку оставляем на следующий раз
+        if end:
+            # save_lead пишет поля через запятую без кавычек (запятые внутри полей заменяет пробелом),
+            # поэтому csv.reader тут нельзя: кавычка в имени «склеила» бы все следующие заявки в одну
+            for line in chunk[:end].decode("utf-8", errors="replace").splitlines():
+                _apply_row(snap, line.split(","))
+            snap["offset"] += end
+        snap["inode"] = st.st_ino
+        snap["head"] = _head(f, snap["offset"])
+    _save_snapshot(snap)
+    return snap
+
+# ---------- ВЫВОД ----------
+
+def _top(bucket: Dict, n: int) -> List[tuple[str, Dict]]:
+    return sorted(bucket.items(), key=lambda kv: kv[1]["leads"], reverse=True)[:n]
+
+def summary_text(snap: Dict, *, top: int = 10, days: int = 7) -> str:
+    lines = [
+        "📊 *Заявки*",
+        f"Всего: **{snap['leads']}**, детей: **{snap['children']}**",
+        "",
+        "*Сад / школа:*",
+    ]
+    lines += [f"• {k}: {v['leads']} (детей {v['children']})" for k, v in _top(snap["by_level"], top)]
+    lines += ["", "*Тип альбома:*"]
+    lines += [f"• {k}: {v['leads']} (детей {v['children']})" for k, v in _top(snap["by_album"], top)]
+    lines += ["", f"*Учреждения (топ {top}):*"]
+    lines += [f"• {k}: {v['leads']} (детей {v['children']})" for k, v in _top(snap["by_org"], top)]
+    recent = sorted(snap["by_day"].items(), reverse=True)[:days]
+    if recent:
+        lines += ["", "*По дням:*"]
+        lines += [f"• {day}: {v['leads']}" for day, v in recent]
+    return "\n".join(lines)
+
+def export_csv(snap: Dict) -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["dimension", "key", "leads", "children"])
+    for dim in DIMENSIONS:
+        for key, cell in sorted(snap[dim].items()):
+            w.writerow([dim, key, cell["leads"], cell["children"]])
+    return buf.getvalue()
+
+def export_json(snap: Dict) -> str:
+    data = {k: v for k, v in snap.items() if k not in ("version", "offset", "inode", "head")}
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+# ---------- КОМАНДЫ ----------
+
+@router.message(Command("leads"))
+async def leads_cmd(message: Message) -> None:
+    await message.answer(summary_text(refresh()))
+
+@router.message(Command("leads_export"))
+async def leads_export_cmd(message: Message, command: CommandObject) -> None:
+    fmt = (command.args or "csv").strip().lower()
+    snap = refresh()
+    if fmt == "json":
+        payload, name = export_json(snap), "lead_stats.json"
+    else:
+        payload, name = export_csv(snap), "lead_stats.csv"
+    await message.answer_document(BufferedInputFile(payload.encode("utf-8"), filename=name))
+
+@router.message(Command("leads_rebuild"))
+async def leads_rebuild_cmd(message: Message) -> None:
+    snap = refresh(rebuild=True)
+    await message.answer(f"Статистика пересчитана: {snap['leads']} заявок.")
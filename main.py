@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import asyncio
-import os
+import re
+from functools import partial
 from pathlib import Path
 from datetime import datetime
 from difflib import SequenceMatcher
@@ -14,38 +15,67 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 from loguru import logger
 
-from knowledge_base import get_faq_answer, normalize
+from envcfg import env_flag
+from knowledge_base import answers, get_faq_answer, normalize
+import intent_model
+import openai_helper
 from openai_helper import ask_gpt
-from booking_router import router as booking_router, cmd_survey
+from booking_router import router as booking_router, cmd_survey, explain_diff
+from broadcast import router as broadcast_router
+from lead_stats import router as lead_stats_router
+import profiling
 from memory_store import append_message  # NEW: persist dialogue
+import price_catalog
+import gpt_slo
+import net
+import send_queue
+import tenants
 
 # ---------------------- ЗАГРУЗКА .env ----------------------
 env_path = Path(__file__).parent / ".env"
 if env_path.exists():
     load_dotenv(env_path)
 
-BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
-if not BOT_TOKEN:
-    raise RuntimeError("BOT_TOKEN пуст. Укажите токен бота в .env")
+TENANTS = tenants.load()  # без tenants.json — один бот из BOT_TOKEN/OWNER_ID
+
+OPENAI_PREWARM = env_flag("OPENAI_PREWARM", True)
 
 # ---------------------- ЛОГИРОВАНИЕ ----------------------
 LOGS_DIR = Path(__file__).parent / "logs"
-LOGS_DIR.mkdir(exist_ok=True)
-logger.add(LOGS_DIR / "bot.log",
-           rotation="2 MB",
-           retention=10,
-           encoding="utf-8",
-           enqueue=True,
-           backtrace=True,
-           diagnose=True)
+
+def setup_logging() -> None:
+    # Файловый sink (с фоновым потоком enqueue) поднимаем только при реальном запуске, не при импорте
+    LOGS_DIR.mkdir(exist_ok=True)
+    logger.add(LOGS_DIR / "bot.log",
+               rotation="2 MB",
+               retention=10,
+               encoding="utf-8",
+               enqueue=True,
+               backtrace=True,
+               diagnose=True)
 
 # ---------------------- БОТ/DP ----------------------
-bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode="Markdown"))
+# Одна HTTP-сессия и одна очередь исходящих на всех ботов; лимиты очередь считает по каждому боту
+session = net.telegram_session()  # пул, keep-alive и таймауты — TG_* в .env
+outbox = send_queue.from_env()  # все исходящие — через очередь с флуд-лимитами
+session.middleware(outbox)
+bots = [Bot(t.token, session=session, default=DefaultBotProperties(parse_mode="Markdown")) for t in TENANTS]
+bot = bots[0]
+tenant_mw = tenants.TenantMiddleware(TENANTS)
 dp = Dispatcher(storage=MemoryStorage())
+dp.update.outer_middleware(tenant_mw)  # тенант по боту: пути данных, каталог цен, OWNER_ID
 router = Router()
+dp.include_router(broadcast_router)  # команды владельца (фильтр по OWNER_ID тенанта)
+dp.include_router(lead_stats_router)
+dp.include_router(profiling.router)
+profiling.setup(dp)  # выключено, пока не PROFILE=1 или /profile on
 dp.include_router(booking_router)  # приоритет FSM
 dp.include_router(router)
 
+# GPT с бюджетом на ответ и предохранителем (GPT_REPLY_BUDGET, GPT_FOLLOWUP, GPT_BREAKER_* в .env)
+gpt_gate = gpt_slo.from_env(ask_gpt, probe=openai_helper.health_probe,
+                            enabled=lambda: bool(openai_helper.OPENAI_API_KEY))
+
 # ---------------------- УТИЛИТЫ ----------------------
 DIALOG_LOG = Path(__file__).parent / "logs" / "dialog_log.txt"
 
@@ -83,6 +113,15 @@ def build_menu_kb() -> ReplyKeyboardMarkup:
     keyboard = [[KeyboardButton(text=txt) for txt in row] for row in rows]
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True, one_time_keyboard=False)
 
+async def send_late_answer(message: Message, user_id: int, question: str, answer: str) -> None:
+    """Поздний ответ GPT (не уложился в бюджет): отдельным сообщением со ссылкой на вопрос."""
+    short = re.sub(r"[*_`\[\]]", "", question.strip())   # цитата не должна ломать Markdown
+    if len(short) > 60:
+        short = short[:57] + "…"
+    late = f"💬 К вопросу «{short}»:\n\n{answer}"
+    await message.answer(late)
+    log_dialog(user_id, "bot", late)
+
 async def send_menu(message: Message, preface: str | None = None) -> None:
     text = preface or ("Чем помочь? Выберите режим:\n"
                        "📝 Пройти опрос — за 1–2 минуты соберём заявку (сад/школа, №, тип, кол-во детей, контакт).\n"
@@ -117,6 +156,29 @@ async def survey_entry(message: Message, state: FSMContext) -> None:
 async def chat_entry(message: Message) -> None:
     await message.answer("Отлично! Задайте вопрос любыми словами — я помогу и подскажу.")
 
+@router.message(Command("prices_reload"), tenants.is_owner)
+async def prices_reload_cmd(message: Message) -> None:
+    # После правки prices.json: ответы FAQ, пояснения опроса и GPT-печать перерисуются сами
+    try:
+        ver = price_catalog.reload()
+    except Exception as e:
+        logger.error(f"prices.json: {e}")
+        await message.answer(f"Не удалось перечитать prices.json: {e}", parse_mode=None)
+        return
+    await message.answer(f"Каталог цен обновлён (версия {ver}).")
+
+@router.message(Command("tenant_stats"), tenants.is_owner)
+async def tenant_stats_cmd(message: Message) -> None:
+    await message.answer(tenant_mw.report(tenants.current().name), parse_mode=None)
+
+@router.message(Command("gpt_stats"), tenants.is_admin)
+async def gpt_stats_cmd(message: Message) -> None:
+    await message.answer(gpt_gate.status(), parse_mode=None)
+
+@router.message(Command("net"), tenants.is_admin)
+async def net_cmd(message: Message) -> None:
+    await message.answer(net.stats_text(), parse_mode=None)
+
 @router.message(Command("ping"))
 async def ping(message: Message) -> None:
     await message.answer("pong")
@@ -160,6 +222,26 @@ async def text_router(message: Message, state: FSMContext) -> None:
             await message.answer("📌 Возможно, вам будет интересно:", reply_markup=kb)
         return
 
+    # 1b) Классификатор намерений: FAQ не уверен, но модель узнаёт тему
+    pred = intent_model.classify(text)
+    if pred is not None and pred.intent in answers():
+        answer = answers()[pred.intent]
+        await message.answer(answer)
+        log_dialog(user_id, "bot_clf", answer)  # свои ответы модели не идут в разметку
+        append_message(user_id, "assistant", answer)
+        return
+
+    # 2) GPT (с контекстом из memory_store) — в пределах бюджета на ответ
+    outcome = await gpt_gate.ask(user_id, text)
+    if outcome.answer:
+        await message.answer(outcome.answer)
+        log_dialog(user_id, "bot", outcome.answer)
+        # ask_gpt уже пишет в memory_store
+        return
+    # не уложился в бюджет — отвечаем сразу подсказками/меню, а ответ GPT дошлём, если придёт
+    gpt_gate.follow_up(outcome, partial(send_late_answer, message, user_id, text))
+
+    # 3) Подсказки FAQ: GPT недоступен, разомкнут предохранитель или не успел
     if res.suggestions:
         kb = ReplyKeyboardMarkup(
             keyboard=[[KeyboardButton(text=s)] for s in res.suggestions],
@@ -167,18 +249,11 @@ async def text_router(message: Message, state: FSMContext) -> None:
         )
         hint = "Я правильно понял вопрос? Выберите тему:"
         await message.answer(hint, reply_markup=kb)
+        log_dialog(user_id, "suggest", "|".join(res.suggestions))  # клик по подсказке = разметка для train_intents.py
         append_message(user_id, "assistant", hint)
         return
 
-    # 2) GPT (с контекстом из memory_store)
-    gpt_answer = await ask_gpt(user_id, text)
-    if gpt_answer:
-        await message.answer(gpt_answer)
-        log_dialog(user_id, "bot", gpt_answer)
-        # ask_gpt уже пишет в memory_store
-        return
-
-    # 3) fallback
+    # 4) fallback
     fallback = "🤔 Могу помочь в диалоге или оформить заявку через опрос. Что предпочитаете?"
     await message.answer(fallback)
     await send_menu(message)
@@ -186,9 +261,48 @@ async def text_router(message: Message, state: FSMContext) -> None:
     log_dialog(user_id, "bot", fallback)
 
 # ---------------------- ЗАПУСК ----------------------
+_background: set[asyncio.Task] = set()
+
+def check_catalogs() -> None:
+    """Каталог цен каждого тенанта: схема и все шаблоны ответов. Ошибка — бот не стартует,
+    а не падает на первом текстовом сообщении."""
+    for t in TENANTS:
+        with tenants.using(t):
+            try:
+                price_catalog.reload()
+                answers()
+                for level in ("сад", "школа"):
+                    explain_diff(level)
+                openai_helper.sealed_instructions()
+            except Exception as e:
+                raise RuntimeError(f"prices.json тенанта {t.name} ({t.prices_path}): {e}") from e
+
+async def on_startup() -> None:
+    check_catalogs()
+    profiling.start_watchdog()
+    intent_model.load()  # ~180 КБ весов; без intent_model.bin бот работает только с FAQ
+    tasks = [net.prewarm_telegram(bots)]  # TCP+TLS до первого сообщения
+    # SDK OpenAI грузится лениво; прогреваем его в фоне, пока бот уже принимает апдейты
+    if OPENAI_PREWARM:
+        tasks.append(openai_helper.prewarm())
+    for coro in tasks:
+        task = asyncio.create_task(coro)
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+async def on_shutdown() -> None:
+    await profiling.watchdog.stop()
+    await gpt_gate.close()   # досылки — до остановки очереди отправки
+    await outbox.close()
+    tenants.log_stats(tenant_mw)
+    await net.close()
+
 async def main():
-    logger.info("🚀 Бот запущен и готов к работе.")
-    await dp.start_polling(bot)
+    setup_logging()
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    logger.info(f"🚀 Бот запущен и готов к работе (тенантов: {len(bots)}).")
+    await dp.start_polling(*bots)
 
 if __name__ == "__main__":
     try:
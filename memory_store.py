@@ -2,68 +2,309 @@
 """
 Простое долговременное хранилище контекста по пользователю (без БД).
 Формат: data/sessions/{user_id}.json  => {history: [...], profile: {...}, updated_at: "..."}
+Каталог сессий — у каждого тенанта свой (tenants.current().sessions_dir).
+
+В памяти сессия — компактные записи (Session со __slots__, HistoryEntry-кортежи, роли интернированы);
+последние SESSION_CACHE сессий держатся в LRU-кэше: чтение горячей сессии не трогает диск и не декодирует,
+запись кодирует один раз. Перед выдачей из кэша сверяются mtime и размер файла (один stat):
+если сессию тем временем записал другой процесс (по процессу на ядро или на токен над общим data/sessions),
+она перечитывается с диска, а не затирается устаревшей копией.
+На диске — JSON (по умолчанию) или компактный бинарный формат (SESSION_FORMAT=bin|msgpack,
+файл {user_id}.ses). При чтении формат определяется автоматически, старые .json читаются всегда
+и при следующей записи переезжают в выбранный формат.
 """
 from __future__ import annotations
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
 import json
-from typing import Dict, List
+import os
+import struct
+import sys
+from functools import lru_cache, partial
+from itertools import accumulate
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import tenants
+from envcfg import env_num
+
+try:  # msgpack — необязательная зависимость
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+_made_dirs: Set[Path] = set()
+
+def _sessions_dir() -> Path:
+    path = tenants.current().sessions_dir
+    if path not in _made_dirs:
+        path.mkdir(parents=True, exist_ok=True)
+        _made_dirs.add(path)
+    return path
+
+SESSION_FORMAT = os.getenv("SESSION_FORMAT", "json").strip().lower()
+if SESSION_FORMAT == "msgpack" and msgpack is None:
+    SESSION_FORMAT = "bin"
+if SESSION_FORMAT not in ("json", "bin", "msgpack"):
+    SESSION_FORMAT = "json"
+
+SESSION_CACHE = env_num("SESSION_CACHE", 1000)   # 0 — без кэша
+
+# ---------- ЗАПИСИ ----------
+
+_KNOWN_ROLES = {r: r for r in ("user", "assistant", "system")}
+
+def _role(role: str) -> str:
+    return _KNOWN_ROLES.get(role) or sys.intern(role)
+
+class HistoryEntry(tuple):
+    """
+    Одно сообщение истории — неизменяемая пара (role, content). Роль интернируется: тысячи записей
+    делят одну строку 'user'/'assistant'. Кортеж, а не класс со __slots__: при декодировании записи
+    создаются пачкой через map() без Python-вызова __init__ на каждую.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, role: str, content: str) -> "HistoryEntry":
+        return tuple.__new__(cls, (_role(role), content))
+
+    role = property(itemgetter(0))
+    content = property(itemgetter(1))
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    def __repr__(self) -> str:
+        return f"HistoryEntry({self.role!r}, {self.content[:30]!r})"
+
+_entry = partial(tuple.__new__, HistoryEntry)   # (role, content) -> HistoryEntry без __new__/__init__ на Python
+
+class Session:
+    __slots__ = ("history", "profile", "updated_at")
+
+    def __init__(self, history: Optional[List[HistoryEntry]] = None,
+                 profile: Optional[Dict] = None, updated_at: str = "") -> None:
+        self.history = history if history is not None else []
+        self.profile = profile if profile is not None else {}
+        self.updated_at = updated_at or _now()
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Session":
+        hist = data.get("history", [])
+        roles = map(_role, [h.get("role", "user") for h in hist])
+        history = list(map(_entry, zip(roles, [h.get("content", "") for h in hist])))
+        return cls(history, dict(data.get("profile", {})), data.get("updated_at", ""))
+
+    def as_dict(self) -> Dict:
+        return {"history": [h.as_dict() for h in self.history], "profile": self.profile, "updated_at": self.updated_at}
 
-DATA_DIR = Path(__file__).parent / "data" / "sessions"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+# ---------- КОДЕКИ ----------
 
-def _file(user_id: int) -> Path:
-    return DATA_DIR / f"{user_id}.json"
+MAGIC = b"CWS\x01"      # v1: длины текстов
+MAGIC_V2 = b"CWS\x02"   # v2: тексты через NUL
+_SEP = "\x00"
+ROLE_CODES = {"user": 0, "assistant": 1, "system": 2}
+ROLES = {v: k for k, v in ROLE_CODES.items()}
+_OTHER_ROLE = 0xFF
+_LEN = struct.Struct("<I")
+
+def encode_json(s: Session) -> bytes:
+    return json.dumps(s.as_dict(), ensure_ascii=False, indent=2).encode("utf-8")
+
+def encode_bin(s: Session) -> bytes:
+    """
+    MAGIC_V2 | updated_at | profile(json) | n | роли u8×n | нестандартные роли (json)
+             | все тексты одним utf-8 блоком через NUL.
+    Колонки вместо записей: при чтении один decode() и один split() на весь блок.
+    Если в каком-то тексте есть NUL — пишем v1 (MAGIC, длины u32×n вместо разделителя).
+    """
+    ts = s.updated_at.encode("utf-8")
+    prof = json.dumps(s.profile, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    n = len(s.history)
+    codes = bytes(ROLE_CODES.get(h.role, _OTHER_ROLE) for h in s.history)
+    extra = json.dumps([h.role for h in s.history if h.role not in ROLE_CODES], ensure_ascii=False).encode("utf-8")
+    contents = [h.content for h in s.history]
+    head = (_LEN.pack(len(ts)), ts, _LEN.pack(len(prof)), prof, _LEN.pack(n), codes)
+    text = _SEP.join(contents)
+    if text.count(_SEP) == max(n - 1, 0):
+        return b"".join((MAGIC_V2, *head, _LEN.pack(len(extra)), extra, text.encode("utf-8")))
+    return b"".join((
+        MAGIC, *head, struct.pack(f"<{n}I", *map(len, contents)), _LEN.pack(len(extra)), extra,
+        "".join(contents).encode("utf-8"),
+    ))
+
+def decode_bin(data: bytes) -> Session:
+    v2 = data.startswith(MAGIC_V2)
+    pos = len(MAGIC)
+
+    def chunk() -> str:
+        nonlocal pos
+        (n,) = _LEN.unpack_from(data, pos)
+        pos += _LEN.size + n
+        return data[pos - n:pos].decode("utf-8")
+
+    updated_at = chunk()
+    profile = json.loads(chunk())
+    (n,) = _LEN.unpack_from(data, pos)
+    pos += _LEN.size
+    codes = data[pos:pos + n]
+    pos += n
+    if not v2:
+        lengths = struct.unpack_from(f"<{n}I", data, pos)
+        pos += 4 * n
+    extra = json.loads(chunk())
+    text = data[pos:].decode("utf-8")
+
+    # нарезка, роли и записи — в C (split/map/zip), без цикла на Python по сообщениям
+    if v2:
+        contents = text.split(_SEP) if n else []
+    else:
+        ends = list(accumulate(lengths))
+        contents = map(text.__getitem__, map(slice, [0] + ends[:-1], ends))
+    if extra:
+        extra_it = iter(extra)
+        roles = [ROLES[c] if c != _OTHER_ROLE else _role(next(extra_it)) for c in codes]
+    else:
+        roles = map(ROLES.__getitem__, codes)
+    return Session(list(map(_entry, zip(roles, contents))), profile, updated_at)
+
+def encode_msgpack(s: Session) -> bytes:
+    history = [[ROLE_CODES.get(h.role, h.role), h.content] for h in s.history]
+    return msgpack.packb([s.updated_at, s.profile, history], use_bin_type=True)
+
+def decode_msgpack(data: bytes) -> Session:
+    updated_at, profile, history = msgpack.unpackb(data, raw=False)
+    return Session([_entry((ROLES.get(r, r) if isinstance(r, int) else _role(r), c)) for r, c in history],
+                   profile, updated_at)
+
+ENCODERS = {"json": encode_json, "bin": encode_bin, "msgpack": encode_msgpack}
+
+def decode(data: bytes) -> Session:
+    """Определить формат по первым байтам и раскодировать."""
+    if data.startswith((MAGIC, MAGIC_V2)):
+        return decode_bin(data)
+    if data.lstrip()[:1] == b"{":
+        return Session.from_dict(json.loads(data.decode("utf-8")))
+    if msgpack is None:
+        raise ValueError("session looks like msgpack, but msgpack is not installed")
+    return decode_msgpack(data)
+
+# ---------- ФАЙЛЫ ----------
+
+@lru_cache(maxsize=4096)
+def _path(base: Path, user_id: int, ext: str) -> Path:
+    # Path / str разбирает путь заново (~10 мкс); на одно сообщение путь нужен десяток раз
+    return base / f"{user_id}{ext}"
+
+def _file(user_id: int, fmt: Optional[str] = None) -> Path:
+    fmt = fmt or SESSION_FORMAT
+    return _path(_sessions_dir(), user_id, ".json" if fmt == "json" else ".ses")
+
+def _legacy_file(user_id: int) -> Path:
+    """Файл «другого» формата — читаем его, если основного ещё нет (миграция)."""
+    return _file(user_id, "bin" if SESSION_FORMAT == "json" else "json")
 
 def _now() -> str:
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def _load(user_id: int) -> Dict:
+# путь файла (включает каталог тенанта) -> (отпечаток файла, сессия); порядок — от давно не использованных к свежим
+_cache: "OrderedDict[Path, Tuple[Optional[Tuple[int, int]], Session]]" = OrderedDict()
+
+def _stamp(fp: Path) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, размер) файла; None — файла нет."""
+    try:
+        st = os.stat(fp)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def _remember(fp: Path, data: Session, stamp: Optional[Tuple[int, int]]) -> None:
+    if SESSION_CACHE <= 0:
+        return
+    _cache[fp] = (stamp, data)
+    _cache.move_to_end(fp)
+    while len(_cache) > SESSION_CACHE:
+        _cache.popitem(last=False)
+
+def _read(user_id: int) -> Session:
+    for fp in (_file(user_id), _legacy_file(user_id)):
+        if fp.exists():
+            try:
+                return decode(fp.read_bytes())
+            except Exception:
+                pass
+    return Session()
+
+def _load(user_id: int, *, remember: bool = True) -> Session:
     fp = _file(user_id)
-    if fp.exists():
-        try:
-            return json.loads(fp.read_text(encoding="utf-8"))
-        except Exception:
-            pass
-    return {"history": [], "profile": {}, "updated_at": _now()}
-
-def _save(user_id: int, data: Dict) -> None:
-    data["updated_at"] = _now()
+    stamp = _stamp(fp)   # до чтения: запись другого процесса посреди чтения даст промах в следующий раз
+    hit = _cache.get(fp)
+    if hit is not None and hit[0] == stamp:
+        _cache.move_to_end(fp)
+        return hit[1]
+    data = _read(user_id)
+    if remember:
+        _remember(fp, data, stamp)
+    return data
+
+def _save(user_id: int, data: Session) -> None:
+    data.updated_at = _now()
     fp = _file(user_id)
-    fp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    fp.write_bytes(ENCODERS[SESSION_FORMAT](data))
+    _remember(fp, data, _stamp(fp))
+    # миграция: после записи в новом формате старый файл больше не нужен
+    old = _legacy_file(user_id)
+    if old.exists():
+        old.unlink()
 
 def append_message(user_id: int, role: str, content: str, *, cap: int = 50) -> None:
     """Добавить сообщение в историю (с ограничением длины)."""
     data = _load(user_id)
-    data.setdefault("history", []).append({"role": role, "content": content})
+    data.history.append(HistoryEntry(role, content))
     # кап истории
-    if len(data["history"]) > cap:
-        data["history"] = data["history"][-cap:]
+    if len(data.history) > cap:
+        data.history = data.history[-cap:]
     _save(user_id, data)
 
 def get_history(user_id: int, limit: int = 20) -> List[Dict[str, str]]:
     """Последние limit сообщений (без системных)."""
-    data = _load(user_id)
-    hist = data.get("history", [])
-    return hist[-limit:] if limit else hist
+    hist = _load(user_id).history
+    hist = hist[-limit:] if limit else hist
+    return [h.as_dict() for h in hist]
 
 def clear_history(user_id: int) -> None:
     data = _load(user_id)
-    data["history"] = []
+    data.history = []
     _save(user_id, data)
 
 def update_profile(user_id: int, **fields) -> Dict:
     """Обновить поля профиля (например: level='сад', org_number='27', ...)."""
     data = _load(user_id)
-    prof = data.setdefault("profile", {})
-    prof.update({k: v for k, v in fields.items() if v is not None})
+    data.profile.update({k: v for k, v in fields.items() if v is not None})
     _save(user_id, data)
-    return prof
+    return dict(data.profile)
 
-def get_profile(user_id: int) -> Dict:
-    return _load(user_id).get("profile", {})
+def get_profile(user_id: int, *, remember: bool = True) -> Dict:
+    """Копия профиля (сессия может лежать в кэше). remember=False — для обходов вроде рассылки,
+    чтобы не вытеснять из кэша сессии тех, кто сейчас в диалоге."""
+    return dict(_load(user_id, remember=remember).profile)
 
 def clear_profile(user_id: int) -> None:
     data = _load(user_id)
-    data["profile"] = {}
+    data.profile = {}
     _save(user_id, data)
+
+def iter_user_ids() -> Iterator[int]:
+    """Потоково перечислить id всех пользователей с сохранённой сессией (файлы не читаются)."""
+    data_dir = _sessions_dir()
+    with os.scandir(data_dir) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            if ext not in (".json", ".ses") or not stem.lstrip("-").isdigit():
+                continue
+            # во время миграции у пользователя могут быть оба файла — считаем один раз
+            if ext == ".json" and (data_dir / f"{stem}.ses").exists():
+                continue
+            yield int(stem)
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Общий сетевой слой для Telegram и OpenAI: пулы соединений, keep-alive, таймауты, прогрев, метрики.
+— Telegram: `PooledSession` (aiohttp) — лимит пула, keep-alive, отдельный таймаут на установку соединения.
+— OpenAI: общий `httpx.AsyncClient` (`HttpxPool`) — лимиты, keep-alive, таймауты, опционально HTTP/2.
+— После старта соединения прогреваются (TCP+TLS заранее), на остановке пулы закрываются.
+— Метрики по каждому эндпоинту: запросы, новые соединения (рукопожатия), TLS, доля переиспользования.
+
+Настройки (env, префикс TG_ или OPENAI_):
+    *_POOL_LIMIT, *_KEEPALIVE (с), *_CONNECT_TIMEOUT (с), *_READ_TIMEOUT (с), *_PREWARM (соединений)
+    OPENAI_HTTP2=1 — HTTP/2 для OpenAI (нужен pip install h2), OPENAI_KEEPWARM=50 — держать соединение тёплым
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import Bot, __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+from loguru import logger
+
+from envcfg import env_flag, env_num
+
+if TYPE_CHECKING:  # httpx нужен только клиенту OpenAI — импортируем при создании пула
+    import httpx
+
+@dataclass(frozen=True)
+class EndpointConfig:
+    name: str
+    limit: int                  # максимум одновременных соединений
+    keepalive: float            # сколько держать простаивающее соединение, с
+    connect_timeout: float      # TCP + TLS, с
+    read_timeout: float         # на ответ, с
+    prewarm: int = 1            # сколько соединений открыть заранее
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls, prefix: str, name: str, *, limit: int, keepalive: float, connect_timeout: float,
+                 read_timeout: float, prewarm: int = 1, http2: bool = False) -> "EndpointConfig":
+        return cls(
+            name=name,
+            limit=env_num(f"{prefix}_POOL_LIMIT", limit),
+            keepalive=env_num(f"{prefix}_KEEPALIVE", float(keepalive)),
+            connect_timeout=env_num(f"{prefix}_CONNECT_TIMEOUT", float(connect_timeout)),
+            read_timeout=env_num(f"{prefix}_READ_TIMEOUT", float(read_timeout)),
+            prewarm=env_num(f"{prefix}_PREWARM", prewarm),
+            http2=env_flag(f"{prefix}_HTTP2", http2),
+        )
+
+TELEGRAM = EndpointConfig.from_env("TG", "telegram", limit=100, keepalive=60, connect_timeout=5,
+                                   read_timeout=60, prewarm=2)
+OPENAI = EndpointConfig.from_env("OPENAI", "openai", limit=20, keepalive=120, connect_timeout=5,
+                                 read_timeout=30, prewarm=1)
+OPENAI_KEEPWARM = env_num("OPENAI_KEEPWARM", 0.0)   # с; 0 — не пинговать
+
+# ---------- МЕТРИКИ ----------
+
+@dataclass
+class NetStats:
+    requests: int = 0
+    connections: int = 0        # новые соединения = TCP-рукопожатия
+    tls: int = 0                # из них с TLS
+    reused: int = 0             # запросы по уже открытому соединению
+    errors: int = 0
+    connect_ms_total: float = 0.0
+    connect_ms_max: float = 0.0
+    last_request: float = 0.0
+
+    def connected(self, ms: float, tls: bool) -> None:
+        self.connections += 1
+        self.tls += tls
+        self.connect_ms_total += ms
+        self.connect_ms_max = max(self.connect_ms_max, ms)
+
+    def as_dict(self) -> Dict[str, float]:
+        done = self.reused + self.connections
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "tls": self.tls,
+            "reused": self.reused,
+            "reuse_rate": round(self.reused / done, 3) if done else 0.0,
+            "errors": self.errors,
+            "connect_ms_avg": round(self.connect_ms_total / self.connections, 1) if self.connections else 0.0,
+            "connect_ms_max": round(self.connect_ms_max, 1),
+        }
+
+# ---------- TELEGRAM (aiohttp) ----------
+
+_AIOGRAM_INTERNALS = ("_connector_type", "_connector_init", "_should_reset_connector")
+
+class PooledSession(AiohttpSession):
+    """AiohttpSession с настраиваемым пулом, keep-alive, connect-таймаутом и метриками соединений."""
+
+    def __init__(self, config: EndpointConfig = TELEGRAM, **kwargs: Any) -> None:
+        kwargs.setdefault("timeout", config.read_timeout)
+        super().__init__(limit=config.limit, **kwargs)
+        self.config = config
+        self.stats = NetStats()
+        # keep-alive и trace-метрики задаются через внутренние поля AiohttpSession (проверено на aiogram 3.4–3.12);
+        # если в другой версии их нет — работаем как обычная сессия, только с connect-таймаутом
+        missing = [a for a in _AIOGRAM_INTERNALS if not hasattr(self, a)]
+        self.tuned = not missing
+        if self.tuned:
+            self._connector_init["keepalive_timeout"] = config.keepalive
+        else:
+            logger.warning(f"aiogram {aiogram_version}: нет {', '.join(missing)} — "
+                           "keep-alive и метрики соединений Telegram отключены")
+
+    def _trace_config(self) -> TraceConfig:
+        stats = self.stats
+        trace = TraceConfig()
+
+        async def on_request_start(session, ctx: SimpleNamespace, params) -> None:
+            stats.requests += 1
+            stats.last_request = time.monotonic()
+            ctx.tls = params.url.scheme == "https"
+
+        async def on_connection_create_start(session, ctx: SimpleNamespace, params) -> None:
+            ctx.t0 = time.perf_counter()
+
+        async def on_connection_create_end(session, ctx: SimpleNamespace, params) -> None:
+            stats.connected((time.perf_counter() - ctx.t0) * 1000, getattr(ctx, "tls", False))
+
+        async def on_connection_reuseconn(session, ctx: SimpleNamespace, params) -> None:
+            stats.reused += 1
+
+        async def on_request_exception(session, ctx: SimpleNamespace, params) -> None:
+            stats.errors += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_start.append(on_connection_create_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_request_exception.append(on_request_exception)
+        return trace
+
+    async def create_session(self) -> ClientSession:
+        # как в AiohttpSession.create_session, плюс trace_configs — их можно передать только в конструктор
+        if not self.tuned:
+            return await super().create_session()
+        if self._should_reset_connector:
+            await self.close()
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+        return self._session
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        # отдельный таймаут на соединение: висящий TCP/TLS не ждёт весь read_timeout
+        total = self.timeout if timeout is None else timeout
+        return await super().make_request(
+            bot, method, timeout=ClientTimeout(total=total, sock_connect=self.config.connect_timeout))
+
+    async def prewarm(self, bot: Bot) -> None:
+        """Открыть `config.prewarm` соединений заранее (параллельные getMe — каждый занимает своё)."""
+        n = max(self.config.prewarm, 0)
+        if n:
+            await asyncio.gather(*(bot.get_me() for _ in range(n)), return_exceptions=True)
+
+# ---------- OPENAI (httpx) ----------
+
+class _HttpxTrace:
+    """Trace-колбэк httpcore на один запрос: было ли новое соединение и сколько заняло."""
+
+    __slots__ = ("stats", "t0", "tcp_ms", "connected")
+
+    def __init__(self, stats: NetStats) -> None:
+        self.stats = stats
+        self.t0 = 0.0
+        self.tcp_ms = 0.0
+        self.connected = False
+
+    async def __call__(self, event: str, info: Dict[str, Any]) -> None:
+        if event == "connection.connect_tcp.started":
+            self.t0 = time.perf_counter()
+        elif event == "connection.connect_tcp.complete":
+            self.connected = True
+            self.tcp_ms = (time.perf_counter() - self.t0) * 1000
+            self.stats.connected(self.tcp_ms, False)
+        elif event == "connection.start_tls.complete":
+            ms = (time.perf_counter() - self.t0) * 1000   # TCP + TLS
+            self.stats.tls += 1
+            self.stats.connect_ms_total += ms - self.tcp_ms
+            self.stats.connect_ms_max = max(self.stats.connect_ms_max, ms)
+
+class HttpxPool:
+    """Один httpx.AsyncClient на процесс: лимиты, keep-alive, таймауты, HTTP/2 и метрики соединений."""
+
+    def __init__(self, config: EndpointConfig = OPENAI) -> None:
+        import httpx
+
+        http2 = config.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning(f"{config.name}: HTTP/2 недоступен (pip install h2) — работаем по HTTP/1.1")
+            http2 = False
+        self.config = config
+        self.stats = NetStats()
+        self.timeout = httpx.Timeout(config.read_timeout, connect=config.connect_timeout)
+        self.client: httpx.AsyncClient = httpx.AsyncClient(
+            http2=http2,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=config.limit,
+                max_keepalive_connections=config.limit,
+                keepalive_expiry=config.keepalive,
+            ),
+            event_hooks={"request": [self._on_request], "response": [self._on_response]},
+        )
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self.stats.requests += 1
+        self.stats.last_request = time.monotonic()
+        request.extensions["trace"] = _HttpxTrace(self.stats)
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        trace = response.request.extensions.get("trace")
+        if isinstance(trace, _HttpxTrace) and not trace.connected:
+            self.stats.reused += 1
+
+    async def prewarm(self, url: str) -> None:
+        """Открыть соединения заранее: HEAD на базовый URL (ответ не важен, важен TCP+TLS в пуле)."""
+        n = max(self.config.prewarm, 0)
+        if n:
+            await asyncio.gather(*(self.client.head(url) for _ in range(n)), return_exceptions=True)
+
+    async def keep_warm(self, url: str, interval: float) -> None:
+        """Раз в interval с, если запросов не было, — лёгкий HEAD, чтобы сервер не закрыл соединение."""
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self.stats.last_request >= interval:
+                try:
+                    await self.client.head(url)
+                except Exception as e:
+                    logger.debug(f"{self.config.name} keep-warm: {e}")
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+# ---------- ОБЩИЕ ПУЛЫ ПРОЦЕССА ----------
+
+_telegram: Optional[PooledSession] = None
+_openai: Optional[HttpxPool] = None
+_tasks: set[asyncio.Task] = set()
+
+def telegram_session() -> PooledSession:
+    """Одна HTTP-сессия на все боты процесса."""
+    global _telegram
+    if _telegram is None:
+        _telegram = PooledSession(TELEGRAM)
+    return _telegram
+
+def openai_pool() -> HttpxPool:
+    """Общий пул для AsyncOpenAI (создаётся при первом обращении к GPT или прогреве)."""
+    global _openai
+    if _openai is None:
+        _openai = HttpxPool(OPENAI)
+    return _openai
+
+async def prewarm_telegram(bots: List[Bot]) -> None:
+    if _telegram is not None and bots:
+        await _telegram.prewarm(bots[0])
+        logger.info(f"Telegram: прогрето соединений {_telegram.stats.connections}")
+
+async def prewarm_openai(base_url: str) -> None:
+    pool = openai_pool()
+    await pool.prewarm(base_url)
+    if OPENAI_KEEPWARM > 0 and not _tasks:
+        task = asyncio.create_task(pool.keep_warm(base_url, OPENAI_KEEPWARM), name="openai-keep-warm")
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+def stats() -> Dict[str, Dict[str, float]]:
+    out = {}
+    if _telegram is not None:
+        out[_telegram.config.name] = _telegram.stats.as_dict()
+    if _openai is not None:
+        out[_openai.config.name] = _openai.stats.as_dict()
+    return out
+
+def stats_text() -> str:
+    lines = []
+    for name, s in stats().items():
+        lines.append(f"{name}: запросов {s['requests']}, соединений {s['connections']} (TLS {s['tls']}), "
+                     f"переиспользовано {s['reuse_rate']:.0%}, connect ср. {s['connect_ms_avg']} мс, ошибок {s['errors']}")
+    return "\n".join(lines) or "Сетевых пулов пока нет."
+
+async def close() -> None:
+    """Закрыть пулы (вызывать на shutdown): сначала фоновые пинги, затем соединения."""
+    for task in list(_tasks):
+        task.cancel()
+    if _openai is not None:
+        await _openai.aclose()
+    if _telegram is not None:
+        await _telegram.close()
+    logger.info(f"Сеть: {stats()}")
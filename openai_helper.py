@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
+from __future__ import annotations
+import asyncio
 import os
 from pathlib import Path
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
 from loguru import logger
 
-from knowledge_base import faq_knowledge
+import net
+import price_catalog
+import price_guard
+from knowledge_base import build_faq_knowledge
 from memory_store import get_history, append_message, get_profile
 
 # ---------------------- ЗАГРУЗКА .env ----------------------
@@ -17,17 +22,42 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY пуст — GPT fallback не будет работать.")
 
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# SDK openai (httpx + pydantic) тяжёлый — импортируем при первом обращении к GPT
 _client: AsyncOpenAI | None = None
 def client() -> AsyncOpenAI | None:
     global _client
     if not OPENAI_API_KEY:
         return None
     if _client is None:
-        _client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        from openai import AsyncOpenAI
+        pool = net.openai_pool()  # общий httpx-пул: лимиты, keep-alive, таймауты, метрики
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=pool.client, timeout=pool.timeout)
     return _client
 
+async def prewarm() -> None:
+    """Загрузить SDK и создать клиента в фоне (в отдельном потоке), затем открыть соединения заранее."""
+    if not OPENAI_API_KEY or _client is not None:
+        return
+    try:
+        cli = await asyncio.to_thread(client)
+        await net.prewarm_openai(str(cli.base_url))
+        logger.info(f"OpenAI клиент прогрет: {net.stats().get('openai')}")
+    except Exception as e:
+        logger.error(f"OpenAI prewarm error: {e}")
+
+async def health_probe() -> bool:
+    """Лёгкий запрос к API для предохранителя gpt_slo: список моделей, без ретраев и с коротким таймаутом."""
+    cli = client()
+    if cli is None:
+        return False
+    await cli.with_options(max_retries=0, timeout=5.0).models.list()
+    return True
+
 SEALED_TOPICS_INSTRUCTIONS = (
-    "ВАЖНО: Все цены, скидки, условия (минимум альбомов, сроки «до марта», "
+    "ВАЖНО: Все цены, скидки, условия (минимум альбомов, сроки «{deadline}», "
     "стоимость дубликатов, стоимость доп. разворотов, форматы и количественные "
     "параметры) — отвечай ТОЛЬКО по фактам из блока Facts. Если вопрос не даёт "
     "контекста (сад/школа/тип альбома), сначала уточни ИЛИ покажи краткие цены "
@@ -36,6 +66,10 @@ SEALED_TOPICS_INSTRUCTIONS = (
     "цены/условия — не придумывай, скажи, что уточнишь у фотографа."
 )
 
+def sealed_instructions() -> str:
+    """SEALED_TOPICS_INSTRUCTIONS со сроком из каталога текущего тенанта (рендер — раз на версию каталога)."""
+    return price_catalog.render_all("gpt_sealed", {"sealed": SEALED_TOPICS_INSTRUCTIONS})["sealed"]
+
 BASE_TONE = (
     "Говори кратко и по делу, дружелюбно. Можешь уточнять 1–2 ключевых момента, "
     "предлагай помощь с бронированием. Не используй канцелярит."
@@ -60,17 +94,9 @@ Client Profile:
 {profile}
 """
 
-KNOWN_FACT_NUMBERS = {"2700","3700","4600","3500","2000","3300","4100","2200","3200","4400","400","600"}
 def looks_like_untrusted_price(answer: str) -> bool:
-    ans = answer.lower()
-    if "₽" not in ans and "руб" not in ans:
-        return False
-    if "50%" in ans or "50 %" in ans:
-        return False
-    for n in KNOWN_FACT_NUMBERS:
-        if n in ans:
-            return False
-    return True
+    """True, если в ответе есть сумма/процент/количество, которых нет в каталоге."""
+    return not price_guard.check(answer, fix=False).ok
 
 async def ask_gpt(user_id: int, user_query: str) -> str | None:
     cli = client()
@@ -87,9 +113,9 @@ async def ask_gpt(user_id: int, user_query: str) -> str | None:
     profile_text = "\n".join(prof_lines) if prof_lines else "- (пока нет данных)"
 
     system_prompt = SYSTEM_PROMPT_TEMPLATE.format(
-        sealed=SEALED_TOPICS_INSTRUCTIONS,
+        sealed=sealed_instructions(),
         tone=BASE_TONE,
-        facts=faq_knowledge,
+        facts=build_faq_knowledge(),
         profile=profile_text,
     )
 
@@ -105,15 +131,16 @@ async def ask_gpt(user_id: int, user_query: str) -> str | None:
         )
         answer = (resp.choices[0].message.content or "").strip()
 
-        # Сохраняем диалог
+        # Каждую цифру сверяем с каталогом: неверные предложения вырезаем, в крайнем случае — безопасная фраза
+        verdict = price_guard.check(answer)
+        if not verdict.ok:
+            logger.warning(f"GPT price guard: {verdict.action}, чужие цифры {[f.value for f in verdict.bad]}")
+        answer = verdict.text
+
+        # Сохраняем диалог (уже проверенный ответ — чтобы выдуманные цены не попадали в контекст)
         append_message(user_id, "user", user_query)
         append_message(user_id, "assistant", answer)
 
-        if looks_like_untrusted_price(answer):
-            safe = "Не могу назвать точную цену. Давайте я уточню у фотографа."
-            append_message(user_id, "assistant", safe)
-            return safe
-
         return answer or None
 
     except Exception as e:
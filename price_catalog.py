@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Единый каталог цен и условий (prices.json) — источник для FAQ, пояснений в опросе и GPT-«печати».
+— Цена меняется одной правкой в prices.json (+ перезапуск или /prices_reload).
+— Тексты рендерятся из шаблонов один раз на версию каталога и дальше отдаются готовыми строками.
+— Набор «известных» чисел для проверки ответов GPT выводится из каталога автоматически.
+— У каждого тенанта свой prices.json (tenants.current().prices_path); каталоги кэшируются по пути.
+— Каталог проверяется при загрузке (`validate`): битый prices.json не подменяет рабочий при /prices_reload,
+  а на старте бот не запускается (main.check_catalogs), вместо того чтобы падать на первом вопросе.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple, TypeVar
+
+import tenants
+
+T = TypeVar("T")
+
+CATALOG_PATH = Path(__file__).parent / "prices.json"   # каталог тенанта по умолчанию
+
+LEVELS = ("kinder", "school")
+KINDS = ("common", "individual")
+
+CONDITIONS = {"min_albums": int, "min_share_pct": int, "deadline": str, "duplicate_pct": int}
+ALBUM_FIELDS = {"name": str, "details": str, "price": int}
+
+# Короткие перечисления цен — в том виде, в каком они были в текстах до каталога
+SHORT_FORMATS = {
+    ("kinder", "common"): "{name} — {price}",
+    ("kinder", "individual"): "{name} {price}",
+    ("school", "common"): "«{name}» {price}",
+    ("school", "individual"): "«{name}» {price}",
+}
+
+_catalogs: Dict[Path, Tuple[str, Dict[str, Any]]] = {}   # путь -> (версия, каталог)
+# кэши по версии каталога; версии, которых больше нет ни у одного тенанта, выбрасываются в reload()
+_rendered: Dict[Tuple[str, str], Dict[str, str]] = {}     # (имя набора, версия) -> тексты
+_derived: Dict[Tuple[str, str], Any] = {}                 # (имя, версия) -> производные данные (derived)
+
+def _path() -> Path:
+    return tenants.current().prices_path
+
+def _is(value: Any, typ: type) -> bool:
+    return isinstance(value, typ) and not isinstance(value, bool)
+
+def validate(cat: Any) -> None:
+    """ValueError со списком всех проблем, если в каталоге нет обязательных разделов или полей."""
+    if not isinstance(cat, dict):
+        raise ValueError("каталог должен быть объектом JSON")
+    problems = []
+    cond = cat.get("conditions")
+    if not isinstance(cond, dict):
+        problems.append("нет раздела conditions")
+    else:
+        problems += [f"conditions.{k}: нужно {t.__name__}" for k, t in CONDITIONS.items() if not _is(cond.get(k), t)]
+    extra = cat.get("extra_spread")
+    if not isinstance(extra, dict):
+        problems.append("нет раздела extra_spread")
+    else:
+        problems += [f"extra_spread.{k}: нужно int" for k in KINDS if not _is(extra.get(k), int)]
+    albums_ = cat.get("albums")
+    for level in LEVELS:
+        for kind in KINDS:
+            items = albums_.get(level, {}).get(kind) if isinstance(albums_, dict) and isinstance(albums_.get(level), dict) else None
+            if not isinstance(items, list) or not items:
+                problems.append(f"albums.{level}.{kind}: нужен непустой список")
+                continue
+            for i, a in enumerate(items):
+                bad = [f for f, t in ALBUM_FIELDS.items() if not isinstance(a, dict) or not _is(a.get(f), t)]
+                if bad:
+                    problems.append(f"albums.{level}.{kind}[{i}]: {', '.join(bad)}")
+    overrides = cat.get("answers")
+    if overrides is not None and not (isinstance(overrides, dict) and all(isinstance(v, str) for v in overrides.values())):
+        problems.append("answers: нужен объект «ключ ответа» -> «шаблон»")
+    if problems:
+        raise ValueError("; ".join(problems))
+
+def reload(path: Optional[Path] = None) -> str:
+    """Перечитать и проверить prices.json (по умолчанию — текущего тенанта); возвращает новую версию (хэш содержимого).
+    При ошибке прежний каталог остаётся в силе."""
+    path = path or _path()
+    raw = path.read_bytes()
+    ver = hashlib.sha1(raw).hexdigest()[:8]
+    cat = json.loads(raw.decode("utf-8"))
+    validate(cat)
+    _catalogs[path] = (ver, cat)
+    _evict()
+    return ver
+
+def _evict() -> None:
+    """После /prices_reload старые версии не нужны: без этого кэши росли бы на каждую правку каталога."""
+    live = {ver for ver, _ in _catalogs.values()}
+    for cache in (_rendered, _derived):
+        for key in [k for k in cache if k[1] not in live]:
+            del cache[key]
+
+def _entry() -> Tuple[str, Dict[str, Any]]:
+    path = _path()
+    if path not in _catalogs:
+        reload(path)
+    return _catalogs[path]
+
+def catalog() -> Dict[str, Any]:
+    return _entry()[1]
+
+def version() -> str:
+    return _entry()[0]
+
+def albums(level: str, kind: str) -> List[Dict[str, Any]]:
+    return catalog()["albums"][level][kind]
+
+# ---------- РЕНДЕР ----------
+
+def _rub(price: int) -> str:
+    return f"**{price} ₽**"
+
+def _price_lines(level: str, kind: str) -> str:
+    """'💰 Мини (4 стр., 2 разворота) — **2700 ₽**' построчно."""
+    lines = []
+    for a in albums(level, kind):
+        line = f"💰 {a['name']} ({a['details']}) — {_rub(a['price'])}"
+        if a.get("note"):
+            line += f", {a['note']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def _price_short(level: str, kind: str) -> str:
+    """'Мини **2700 ₽**, Лайт **3700 ₽**', '«Классный» **2200 ₽**, ...' — для коротких сравнений."""
+    fmt = SHORT_FORMATS.get((level, kind), "{name} {price}")
+    return ", ".join(fmt.format(name=a["name"], price=_rub(a["price"])) for a in albums(level, kind))
+
+def context() -> Dict[str, str]:
+    """Подстановки для шаблонов: {kinder_individual}, {school_common_short}, {min_albums}, ..."""
+    cat = catalog()
+    cond = cat["conditions"]
+    ctx: Dict[str, Any] = {
+        "min_albums": cond["min_albums"],
+        "min_share": f"{cond['min_share_pct']}%",
+        "deadline": cond["deadline"],
+        "duplicate": f"{cond['duplicate_pct']}%",
+        "extra_common": f"{cat['extra_spread']['common']} ₽",
+        "extra_individual": f"{cat['extra_spread']['individual']} ₽",
+    }
+    for level in LEVELS:
+        for kind in KINDS:
+            ctx[f"{level}_{kind}"] = _price_lines(level, kind)
+            ctx[f"{level}_{kind}_short"] = _price_short(level, kind)
+    return ctx
+
+def render_all(name: str, templates: Dict[str, str]) -> Dict[str, str]:
+    """Отрендерить набор шаблонов (str.format) — один раз на версию каталога."""
+    key = (name, version())   # одинаковые каталоги разных тенантов делят рендер
+    out = _rendered.get(key)
+    if out is None:
+        ctx = context()
+        out = {}
+        for k, tpl in templates.items():
+            try:
+                out[k] = tpl.format(**ctx)
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"шаблон {name}/{k}: неизвестная или неверная подстановка {e}") from e
+        _rendered[key] = out
+    return out
+
+def derived(name: str, build: Callable[[], T]) -> T:
+    """Значение, посчитанное из каталога текущего тенанта, — один раз на версию (общая для тенантов с одинаковым каталогом)."""
+    key = (name, version())
+    if key not in _derived:
+        _derived[key] = build()
+    return _derived[key]
+
+# ---------- ФАКТЫ ДЛЯ GPT-ПЕЧАТИ ----------
+
+def known_prices() -> FrozenSet[str]:
+    """Все суммы каталога (цены альбомов и доплаты за развороты) строками — для проверки ответов GPT."""
+    return derived("prices", _known_prices)
+
+def _known_prices() -> FrozenSet[str]:
+    cat = catalog()
+    prices = {a["price"] for level in LEVELS for kind in KINDS for a in albums(level, kind)}
+    prices.update(cat["extra_spread"].values())
+    return frozenset(str(p) for p in prices)
+
+def known_percents() -> FrozenSet[str]:
+    cond = catalog()["conditions"]
+    return frozenset(str(cond[k]) for k in ("min_share_pct", "duplicate_pct"))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка ответа GPT на цифры, которых нет в каталоге (prices.json).
+— Один скомпилированный сканер за один проход находит суммы (₽/руб), проценты и количества
+  рядом с единицами («от N альбомов», стр., разворотов), включая диапазоны «2700–4600 ₽»,
+  валюту перед числом («₽2700», «RUB 2700»), «р» без точки и тысячи («4,6 тыс. руб.», «5к ₽»).
+— Ненулевые копейки («2700.99 ₽», «50,5%») — значение не из каталога.
+— Количество альбомов проверяется как условие заказа не только после «от/минимум/не менее», но и
+  в формулировках «минимальный заказ — N альбомов», «N альбомов и больше», «N+ альбомов».
+— Каждое значение сверяется с фактами каталога; результат — структурный вердикт.
+— Если неверные цифры есть, вырезаются только предложения/строки с ними; если от ответа
+  ничего не осталось (или он целиком про цены) — ответ блокируется.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional, Tuple
+
+import price_catalog
+
+SAFE_REPLY = "Не могу назвать точную цену. Давайте я уточню у фотографа."
+SAFE_NOTE = "Точную стоимость уточню у фотографа."
+
+_NUM = r"\d{1,3}(?:[ \u00a0\u202f]\d{3})+|\d+"   # 2700, 2 700, 2\u00a0700
+_FRAC = r"[.,]\d{1,2}"
+_GAP = r"[*_\s]*"
+SCANNER = re.compile(
+    rf"(?P<cur>₽|\bRUB\b){_GAP}(?P<c>{_NUM})(?P<fc>{_FRAC})?"
+    r"|(?:(?P<min>\bот|минимум|не\s+менее)\s+)?"
+    rf"(?P<a>{_NUM})(?P<fa>{_FRAC})?(?P<plus>\+)?"
+    rf"(?:{_GAP}(?:[-–—]|до){_GAP}(?P<b>{_NUM})(?P<fb>{_FRAC})?)?"
+    rf"{_GAP}(?:"
+    rf"(?:(?P<k>тыс(?:\.|яч[а-я]*)?|к\b){_GAP})?(?P<money>₽|руб(?:\.|л[а-я]*)?|р\.?(?!\w)|RUB\b)"
+    r"|(?P<pct>%|процент[а-я]*)"
+    r"|(?P<albums>альбом[а-я]*)"
+    r"|(?P<pages>стр(?:\.|аниц[а-я]*)?|разворот[а-я]*)"
+    r")",
+    re.I | re.U,
+)
+# граница предложения: перевод строки или [.!?] + пробел + заглавная/маркер списка («стр., 2 разворота» не режем)
+_BOUNDARY = re.compile(r"\n|(?<=[.!?])[ \t]+(?=[A-ZА-ЯЁ«\"*•💰])", re.U)
+_DIGITS = re.compile(r"\d+")
+# количество альбомов — условие заказа, если рядом порог: «минимальный заказ — 20 альбомов», «10 альбомов и больше»
+_ALBUM_CUE_BEFORE = re.compile(r"(?:минимал[а-я]*|минимум|не\s+менее|не\s+меньше|хотя\s+бы)[^.!?\n\d]{0,30}$", re.I | re.U)
+_ALBUM_CUE_AFTER = re.compile(r"[*_]*\s*(?:\+|(?:и|или)\s+(?:больше|более))", re.I | re.U)
+
+@dataclass(frozen=True)
+class Finding:
+    kind: str        # money | percent | albums | pages
+    value: int
+    start: int
+    end: int
+    known: bool
+
+@dataclass(frozen=True)
+class Verdict:
+    action: str                       # pass | fixed | blocked
+    text: str                         # текст для отправки
+    findings: Tuple[Finding, ...] = ()
+
+    @property
+    def ok(self) -> bool:
+        return self.action == "pass"
+
+    @property
+    def bad(self) -> Tuple[Finding, ...]:
+        return tuple(f for f in self.findings if not f.known)
+
+# ---------- ФАКТЫ ----------
+
+def facts() -> dict:
+    """Множества допустимых значений по видам; считаются один раз на версию каталога (тенанта)."""
+    return price_catalog.derived("guard_facts", _build_facts)
+
+def _build_facts() -> dict:
+    cond = price_catalog.catalog()["conditions"]
+    pages = set()
+    for level in price_catalog.LEVELS:
+        for kind in price_catalog.KINDS:
+            for a in price_catalog.albums(level, kind):
+                pages.update(int(d) for d in _DIGITS.findall(a["details"] + " " + a["name"]))
+    return {
+        "money": _ints(price_catalog.known_prices()),
+        "percent": _ints(price_catalog.known_percents()),
+        "albums": frozenset({cond["min_albums"]}),
+        "pages": frozenset(pages),
+    }
+
+def _ints(values) -> FrozenSet[int]:
+    return frozenset(int(v) for v in values)
+
+def _to_int(raw: str) -> int:
+    return int(re.sub(r"\D", "", raw))
+
+# ---------- ПРОВЕРКА ----------
+
+_AFTER_GROUPS = (("a", "fa"), ("b", "fb"))   # число (и конец диапазона) + копейки
+_CUR_GROUPS = (("c", "fc"),)
+
+def scan(text: str) -> List[Finding]:
+    """Все суммы/проценты/количества в тексте, с пометкой known."""
+    known = facts()
+    out: List[Finding] = []
+    for m in SCANNER.finditer(text):
+        groups = _AFTER_GROUPS
+        if m.group("cur"):
+            kind, groups = "money", _CUR_GROUPS   # «₽2700», «RUB 2700»
+        elif m.group("money"):
+            kind = "money"
+        elif m.group("pct"):
+            kind = "percent"
+        elif m.group("pages"):
+            kind = "pages"
+        elif m.group("min") or _album_condition(text, m):
+            kind = "albums"   # «от 15 альбомов», «минимальный заказ — 20 альбомов» — условие; «2 альбома» — количество
+        else:
+            continue
+        allowed = known[kind]
+        scale = 1000 if m.group("k") else 1
+        for g, fg in groups:
+            raw = m.group(g)
+            if raw is None:
+                continue
+            value, exact = _amount(raw, m.group(fg), scale)
+            out.append(Finding(kind, value, m.start(g), m.end(g), exact and value in allowed))
+    return out
+
+def _amount(raw: str, frac: Optional[str], scale: int) -> Tuple[int, bool]:
+    """«4,6» тыс. -> 4600; «2700.99» -> (2700, False): копеек в каталоге нет, «2700.00» — то же, что 2700."""
+    cents = int(frac[1:].ljust(2, "0")) if frac else 0
+    total = _to_int(raw) * 100 + cents
+    value, rest = divmod(total * scale, 100)
+    return value, not rest
+
+def _album_condition(text: str, m: re.Match) -> bool:
+    return bool(m.group("plus") or _ALBUM_CUE_BEFORE.search(text, max(0, m.start() - 50), m.start())
+                or _ALBUM_CUE_AFTER.match(text, m.end()))
+
+def check(text: str, *, fix: bool = True) -> Verdict:
+    findings = scan(text)
+    if all(f.known for f in findings):
+        return Verdict("pass", text, tuple(findings))
+    if not fix:
+        return Verdict("blocked", SAFE_REPLY, tuple(findings))
+
+    bad_pos = [f.start for f in findings if not f.known]
+    kept: List[str] = []
+    pos = 0
+    for end, sep in [(m.start(), m.group()) for m in _BOUNDARY.finditer(text)] + [(len(text), "")]:
+        if not any(pos <= p < end for p in bad_pos):
+            kept += [text[pos:end], sep]
+        elif sep == "\n":
+            kept.append(sep)
+        pos = end + len(sep)
+    fixed = re.sub(r"\n{3,}", "\n\n", "".join(kept)).strip()
+    # если убрали всё, что было про цены (или почти весь ответ) — отвечаем безопасной фразой
+    if not fixed or not any(ch.isalpha() for ch in fixed) or len(fixed) < len(text) // 3:
+        return Verdict("blocked", SAFE_REPLY, tuple(findings))
+    return Verdict("fixed", f"{fixed}\n\n{SAFE_NOTE}", tuple(findings))
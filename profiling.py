@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+Профилирование хендлеров по требованию (по умолчанию выключено).
+— Middleware на message/callback_query: время каждого хендлера и cProfile для доли апдейтов (sampling).
+  cProfile видит весь поток loop: если параллельно шли другие апдейты, дамп помечается как loop-wide.
+— Медленные апдейты ловит семплер стеков задачи: поток раз в PROFILE_STACK_MS снимает стек именно
+  этой asyncio-задачи (где она считает или чего ждёт) — чужие апдейты, send_queue и GPT других
+  пользователей в отчёт не попадают. Отчёт — свёрнутые стеки (формат flamegraph) в logs/profiles/.
+— Watchdog event loop: фоновый поток замечает, что loop «завис» дольше порога,
+  и пишет в лог стек того кода, который его блокирует.
+— Выключенный режим: одна проверка флага на апдейт.
+
+Включение: env PROFILE=1 (PROFILE_SAMPLE, PROFILE_SLOW_MS, PROFILE_WATCHDOG_MS) или команда администратора (ADMIN_ID):
+    /profile on|off|status
+    /profile sample 0.05       — доля апдейтов под cProfile
+    /profile slow 800          — порог «медленного» хендлера, мс (0 — не снимать стеки)
+    /profile watchdog 200      — порог лага loop, мс (0 — выключить)
+"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import io
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from loguru import logger
+
+import tenants
+from envcfg import env_flag, env_num
+
+PROFILES_DIR = Path(__file__).parent / "logs" / "profiles"
+
+# ---------- СЕМПЛЕР СТЕКОВ ЗАДАЧ ----------
+
+def _frame_label(f: FrameType) -> str:
+    return f"{Path(f.f_code.co_filename).name}:{f.f_lineno} {f.f_code.co_name}"
+
+def _await_chain(coro: Any) -> List[FrameType]:
+    """Кадры приостановленной корутины по цепочке await (Task.get_stack даёт только внешний)."""
+    frames = []
+    while coro is not None:
+        f = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if f is None:
+            break
+        frames.append(f)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+class TaskSampler:
+    """
+    Поток, который раз в `interval` снимает стек каждой отслеживаемой asyncio-задачи:
+    — задача сейчас выполняется в loop — берём реальный стек потока loop, начиная с кадра её корутины (cpu);
+    — задача приостановлена — цепочку await её корутины (wait): видно, чего именно она ждёт.
+    Время считается по задаче, а не по потоку, поэтому работа других апдейтов в отчёт не попадает.
+    """
+
+    def __init__(self, interval: float = 0.01, depth: int = 16) -> None:
+        self.interval = interval
+        self.depth = depth
+        self._tasks: Dict[asyncio.Task, Counter] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, task: asyncio.Task) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="task-sampler", daemon=True)
+            self._thread.start()
+        self._tasks[task] = Counter()
+        self._wake.set()
+
+    def untrack(self, task: asyncio.Task) -> Counter:
+        return self._tasks.pop(task, None) or Counter()
+
+    def _stack(self, task: asyncio.Task) -> Tuple[str, ...]:
+        coro = task.get_coro()
+        if asyncio.current_task(self._loop) is task:
+            top = getattr(coro, "cr_frame", None)
+            frame = sys._current_frames().get(self._loop_thread)
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                if frame is top:
+                    break
+                frame = frame.f_back
+            frames.reverse()
+            kind = "[cpu]"
+        else:
+            frames = _await_chain(coro)
+            kind = "[wait]"
+        labels = tuple(_frame_label(f) for f in frames[-self.depth:])
+        return labels + (kind,)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            if not self._tasks:   # сброс до проверки: track() между ними не потеряется
+                self._wake.wait()
+            time.sleep(self.interval)
+            for task, samples in list(self._tasks.items()):
+                try:
+                    samples[self._stack(task)] += 1
+                except Exception:   # кадры меняются на ходу — пропускаем семпл
+                    pass
+
+# ---------- MIDDLEWARE ----------
+
+class ProfilingMiddleware(BaseMiddleware):
+    def __init__(self, *, enabled: bool = False, sample: float = 0.0, slow_ms: float = 1000.0,
+                 stack_ms: float = 10.0, keep: int = 200) -> None:
+        self.enabled = enabled
+        self.sample = sample        # доля апдейтов под cProfile
+        self.slow_ms = slow_ms      # > 0: стеки задачи семплируются, отчёт — если апдейт медленнее
+        self.keep = keep            # сколько файлов профилей хранить
+        self.sampler = TaskSampler(interval=stack_ms / 1000)
+        self._busy = False          # cProfile один на поток: параллельные апдейты только таймим
+        self._inflight = 0          # апдейтов в обработке сейчас
+        self._started = 0           # апдейтов начато всего (для поиска пересечений)
+        self.stats: Dict[str, list] = {}   # handler -> [count, total_ms, max_ms]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self.enabled:
+            return await handler(event, data)
+
+        name = getattr(getattr(data.get("handler"), "callback", None), "__name__", "?")
+        task = asyncio.current_task()
+        prof: Optional[cProfile.Profile] = None
+        if self.sample > 0 and random.random() < self.sample and not self._busy:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+                self._busy = True
+            except ValueError:   # активен другой профайлер
+                prof = None
+        if self.slow_ms > 0 and task is not None:
+            self.sampler.track(task)
+        overlapped = self._inflight > 0
+        started = self._started
+        self._inflight += 1
+        self._started += 1
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = (time.perf_counter() - t0) * 1000
+            self._inflight -= 1
+            overlapped = overlapped or self._started - started > 1
+            if prof is not None:
+                prof.disable()
+                self._busy = False
+            samples = self.sampler.untrack(task) if task is not None else Counter()
+            self._record(name, elapsed)
+            route = _route(event, data)
+            if self.slow_ms > 0 and elapsed >= self.slow_ms:
+                logger.warning(f"Медленный хендлер {name} [{route}]: {elapsed:.0f} мс")
+                if samples:
+                    self._dump_stacks(samples, name, route, elapsed)
+            if prof is not None:
+                self._dump(prof, name, route, elapsed, loop_wide=overlapped)
+
+    def _record(self, name: str, elapsed: float) -> None:
+        s = self.stats.setdefault(name, [0, 0.0, 0.0])
+        s[0] += 1
+        s[1] += elapsed
+        s[2] = max(s[2], elapsed)
+
+    def _path(self, name: str, route: str, elapsed: float, suffix: str) -> Path:
+        PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+        ts = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        return PROFILES_DIR / f"{ts}_{name}_{_slug(route)}_{elapsed:.0f}ms{suffix}"
+
+    def _dump(self, prof: cProfile.Profile, name: str, route: str, elapsed: float, *, loop_wide: bool) -> None:
+        fp = self._path(name, route, elapsed, "_loopwide.prof" if loop_wide else ".prof")
+        prof.dump_stats(fp)
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(15)
+        note = " (loop-wide: параллельно шли другие апдейты — их работа тоже в профиле)" if loop_wide else ""
+        logger.info(f"Профиль {name} [{route}] {elapsed:.0f} мс{note} -> {fp.name}\n{buf.getvalue()}")
+        self._prune()
+
+    def _dump_stacks(self, samples: Counter, name: str, route: str, elapsed: float) -> None:
+        """Свёрнутые стеки задачи: «кадр;кадр;...;[cpu|wait] число_семплов» — вход для flamegraph.pl / speedscope."""
+        fp = self._path(name, route, elapsed, ".stacks.txt")
+        total = sum(samples.values())
+        lines = [f"{';'.join(stack)} {n}" for stack, n in samples.most_common()]
+        fp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        cpu = sum(n for stack, n in samples.items() if stack[-1] == "[cpu]")
+        top = "\n".join(f"  {n * 100 / total:5.1f}%  {' <- '.join(reversed(stack[-4:]))}" for stack, n in samples.most_common(5))
+        logger.info(f"Стеки {name} [{route}] {elapsed:.0f} мс: {total} семплов, в loop {cpu * 100 / total:.0f}% -> {fp.name}\n{top}")
+        self._prune()
+
+    def _prune(self) -> None:
+        files = sorted(p for p in PROFILES_DIR.iterdir() if p.suffix in (".prof", ".txt"))
+        for old in files[:-self.keep]:
+            old.unlink(missing_ok=True)
+
+    def status(self) -> str:
+        lines = [
+            f"Профилирование: {'вкл' if self.enabled else 'выкл'}",
+            f"• sample: {self.sample:g}",
+            f"• slow: {self.slow_ms:g} мс",
+        ]
+        for name, (count, total, worst) in sorted(self.stats.items(), key=lambda kv: -kv[1][1]):
+            lines.append(f"• {name}: {count} шт., ср. {total / count:.1f} мс, макс. {worst:.0f} мс")
+        return "\n".join(lines)
+
+def _route(event: TelegramObject, data: Dict[str, Any]) -> str:
+    """Короткое описание маршрута: команда / тип сообщения + состояние FSM."""
+    if isinstance(event, CallbackQuery):
+        route = f"cb:{event.data or ''}"
+    elif isinstance(event, Message):
+        text = (event.text or "").strip()
+        route = text.split()[0] if text.startswith("/") else ("text" if text else event.content_type)
+    else:
+        route = type(event).__name__
+    state = data.get("raw_state")
+    return f"{route}@{state}" if state else route
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w@.-]+", "_", text)[:40]
+
+# ---------- WATCHDOG ----------
+
+class LoopWatchdog:
+    """
+    Корутина раз в `interval` обновляет heartbeat; поток-наблюдатель проверяет его и,
+    если loop не отвечал дольше `threshold`, снимает стек потока loop (что именно блокирует).
+    """
+
+    def __init__(self, threshold_ms: float = 200.0, interval: float = 0.05) -> None:
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.max_lag_ms = 0.0
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop = threading.Event()   # свой флаг на каждый запуск: старый поток мог ещё не выйти
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, args=(self._stop,), name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = (now - before - self.interval) * 1000
+            self.max_lag_ms = max(self.max_lag_ms, lag)
+            self._beat = now
+
+    def _watch(self, stop: threading.Event) -> None:
+        reported = 0.0   # heartbeat, по которому уже отчитались
+        while not stop.wait(self.threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or beat == reported:
+                continue
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(стек недоступен)"
+            logger.warning(f"Event loop заблокирован {stalled * 1000:.0f}+ мс, стек:\n{stack}")
+
+    def status(self) -> str:
+        state = "вкл" if self.running else "выкл"
+        return f"Watchdog: {state}, порог {self.threshold * 1000:.0f} мс, зависаний {self.stalls}, макс. лаг {self.max_lag_ms:.0f} мс"
+
+# ---------- НАСТРОЙКА / КОМАНДЫ ----------
+
+middleware = ProfilingMiddleware(
+    enabled=env_flag("PROFILE", False),
+    sample=env_num("PROFILE_SAMPLE", 0.0),
+    slow_ms=env_num("PROFILE_SLOW_MS", 1000.0),
+    stack_ms=env_num("PROFILE_STACK_MS", 10.0),
+)
+watchdog = LoopWatchdog(threshold_ms=env_num("PROFILE_WATCHDOG_MS", 200.0))
+
+def setup(dp) -> None:
+    """Подключить middleware ко всем хендлерам сообщений и колбэков."""
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+
+def start_watchdog() -> None:
+    """Запустить watchdog, если профилирование включено через env (вызывать из работающего loop)."""
+    if middleware.enabled and watchdog.threshold > 0:
+        watchdog.start()
+
+router = Router()
+router.message.filter(tenants.is_admin)  # статистика и профили общие на весь процесс
+
+@router.message(Command("profile"))
+async def profile_cmd(message: Message, command: CommandObject) -> None:
+    args = (command.args or "status").split()
+    action, value = args[0].lower(), (args[1] if len(args) > 1 else "")
+    try:
+        if action == "on":
+            middleware.enabled = True
+            if watchdog.threshold > 0:
+                watchdog.start()
+        elif action == "off":
+            middleware.enabled = False
+            await watchdog.stop()
+        elif action == "sample":
+            middleware.sample = min(max(float(value), 0.0), 1.0)
+        elif action == "slow":
+            middleware.slow_ms = max(float(value), 0.0)
+        elif action == "watchdog":
+            watchdog.threshold = max(float(value), 0.0) / 1000
+            if watchdog.threshold > 0:
+                watchdog.start()
+            else:
+                await watchdog.stop()
+        elif action != "status":
+            raise ValueError(action)
+    except ValueError:
+        await message.answer("Формат: `/profile on|off|status`, `/profile sample 0.05`, "
+                             "`/profile slow 800`, `/profile watchdog 200`")
+        return
+    await message.answer(f"{middleware.status()}\n{watchdog.status()}", parse_mode=None)
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь исходящих сообщений с учётом флуд-лимитов Telegram.
+— Подключается как request-middleware к сессии `Bot`: все `message.answer(...)`,
+  `bot.send_message(...)` и т.п. проходят через неё без правок в хендлерах.
+— Глобальный лимит (~30 сообщений/с) и лимит на чат (~1 сообщение/с с небольшим «залпом»).
+  Лимиты считаются отдельно для каждого бота: одна очередь обслуживает всех тенантов.
+— Приоритетные полосы: ответы в диалоге идут раньше уведомлений и рассылок.
+— `TelegramRetryAfter` обрабатывается автоматически: чат и общий лимит бота «замораживаются», запрос повторяется.
+— Опционально склеивает подряд идущие текстовые сообщения в один чат.
+— Время ожидания в очереди считается по полосам (см. `SendQueue.stats()`).
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Dict, Iterator, List, Optional
+
+from aiogram import Bot
+from aiogram.client.default import Default
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage,
+    EditMessageText,
+    ForwardMessage,
+    SendDocument,
+    SendMediaGroup,
+    SendMessage,
+    SendPhoto,
+    TelegramMethod,
+)
+from loguru import logger
+
+from envcfg import env_flag, env_num
+
+# Методы, которые Telegram считает «сообщениями» и лимитирует.
+# getUpdates, answerCallbackQuery, sendChatAction и прочее идут мимо очереди.
+QUEUED_METHODS = (SendMessage, SendPhoto, SendDocument, SendMediaGroup, CopyMessage, ForwardMessage, EditMessageText)
+
+TEXT_LIMIT = 4096  # максимум символов в одном сообщении Telegram
+PRUNE_INTERVAL = 60.0  # раз в столько секунд выбрасываем простаивающие бакеты чатов
+
+class Priority(IntEnum):
+    INTERACTIVE = 0   # ответ пользователю в диалоге
+    NOTIFY = 1        # уведомления владельцу
+    BULK = 2          # рассылки
+
+_priority: ContextVar[Priority] = ContextVar("send_priority", default=Priority.INTERACTIVE)
+
+@contextmanager
+def send_priority(priority: Priority) -> Iterator[None]:
+    """Все отправки внутри блока попадут в указанную полосу очереди."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+# ---------- ЛИМИТЕРЫ ----------
+
+class TokenBucket:
+    """Классический token bucket: `rate` токенов в секунду, не больше `burst` про запас."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "blocked_until")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до следующего токена (0 — можно отправлять)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        """Бакет полон и не заморожен — его можно выбросить и создать заново без потери состояния."""
+        if now < self.blocked_until:
+            return False
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def block(self, seconds: float) -> None:
+        """Заморозить бакет (после RetryAfter от Telegram)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+# ---------- ОЧЕРЕДЬ ----------
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    chat_id: Any = field(compare=False)
+    method: TelegramMethod = field(compare=False)
+    make_request: NextRequestMiddlewareType = field(compare=False)
+    bot: Bot = field(compare=False)
+    enqueued: float = field(compare=False)
+    futures: List[asyncio.Future] = field(compare=False, default_factory=list)
+    retries: int = field(compare=False, default=0)
+
+    @property
+    def key(self) -> tuple:
+        """Лимит на чат у Telegram — в рамках одного бота."""
+        return self.bot.id, self.chat_id
+
+@dataclass
+class LaneStats:
+    sent: int = 0
+    merged: int = 0
+    retried: int = 0
+    failed: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        avg = self.wait_total / self.sent if self.sent else 0.0
+        return {
+            "sent": self.sent, "merged": self.merged, "retried": self.retried, "failed": self.failed,
+            "wait_avg": round(avg, 4), "wait_max": round(self.wait_max, 4),
+        }
+
+def _parse_mode(method: SendMessage) -> Any:
+    # Default("parse_mode") не умеет сравниваться — сводим к имени
+    mode = method.parse_mode
+    return ("default", mode.name) if isinstance(mode, Default) else mode
+
+def _checked(name: str, value: float, default: float, *, minimum: float = 0.0) -> float:
+    """Скорость 0 или меньше (и burst меньше 1) остановили бы отправку совсем — берём значение по умолчанию."""
+    if value > 0 and value >= minimum:
+        return value
+    logger.warning(f"SendQueue: {name}={value} недопустимо, берём {default}")
+    return default
+
+class SendQueue(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов. Подключение:
+        outbox = SendQueue()
+        bot.session.middleware(outbox)
+    """
+
+    def __init__(
+        self,
+        *,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        merge: bool = False,
+        max_retries: int = 3,
+        slow_wait: float = 2.0,
+    ) -> None:
+        self.global_rate = _checked("global_rate", global_rate, 30.0)
+        self._bots: Dict[int, TokenBucket] = {}
+        self.chat_rate = _checked("chat_rate", chat_rate, 1.0)
+        self.chat_burst = _checked("chat_burst", chat_burst, 3.0, minimum=1.0)
+        self.merge = merge
+        self.max_retries = max_retries
+        self.slow_wait = slow_wait  # ожидание дольше этого пишем в лог warning-ом
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._pruned_at = time.monotonic()
+        self._heap: List[_Job] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._inflight: set[asyncio.Task] = set()
+        self._stats: Dict[Priority, LaneStats] = {p: LaneStats() for p in Priority}
+
+    # --- middleware ---
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(method, QUEUED_METHODS) or chat_id is None:
+            return await make_request(bot, method)
+        return await self.submit(make_request, bot, method, _priority.get())
+
+    async def submit(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod, priority: Priority):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        job = _Job(int(priority), next(self._seq), method.chat_id, method, make_request, bot, time.monotonic(), [fut])
+        if not (self.merge and self._try_merge(job)):
+            heapq.heappush(self._heap, job)
+        self._ensure_runner()
+        self._wakeup.set()
+        return await fut
+
+    def _try_merge(self, job: _Job) -> bool:
+        """Склеить текст с последним ожидающим сообщением в тот же чат, если это безопасно."""
+        if not isinstance(job.method, SendMessage):
+            return False
+        last: Optional[_Job] = None
+        for queued in self._heap:
+            if queued.key == job.key and queued.priority == job.priority and (last is None or queued.seq > last.seq):
+                last = queued
+        if last is None or not isinstance(last.method, SendMessage):
+            return False
+        prev, cur = last.method, job.method
+        if prev.reply_markup is not None or _parse_mode(prev) != _parse_mode(cur) or cur.reply_parameters or cur.reply_to_message_id \
+                or prev.entities or cur.entities:
+            return False
+        text = f"{prev.text}\n\n{cur.text}"
+        if len(text) > TEXT_LIMIT:
+            return False
+        last.method = prev.model_copy(update={"text": text, "reply_markup": cur.reply_markup})
+        last.futures.extend(job.futures)
+        self._stats[Priority(job.priority)].merged += 1
+        return True
+
+    # --- планировщик ---
+    def _ensure_runner(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run(), name="send-queue")
+
+    def _global_bucket(self, bot: Bot) -> TokenBucket:
+        bucket = self._bots.get(bot.id)
+        if bucket is None:
+            bucket = self._bots[bot.id] = TokenBucket(self.global_rate, self.global_rate)
+        return bucket
+
+    def _chat_bucket(self, key: tuple) -> TokenBucket:
+        bucket = self._chats.get(key)
+        if bucket is None:
+            bucket = self._chats[key] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        """После рассылки бакеты всех получателей иначе остались бы в памяти навсегда."""
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        for key in [k for k, b in self._chats.items() if b.idle(now)]:
+            del self._chats[key]
+
+    def _pick(self, now: float) -> tuple[Optional[_Job], float]:
+        """Самая приоритетная задача, чей бот и чат готовы; иначе — сколько ждать."""
+        wait = float("inf")
+        for job in sorted(self._heap):
+            d = max(self._global_bucket(job.bot).delay(now), self._chat_bucket(job.key).delay(now))
+            if d <= 0:
+                return job, 0.0
+            wait = min(wait, d)
+        return None, wait
+
+    async def _run(self) -> None:
+        try:
+            await self._schedule()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # без планировщика ожидающие message.answer() зависли бы навсегда;
+            # следующий submit запустит его заново
+            logger.exception(f"Планировщик очереди отправки упал: {e}")
+            for job in self._heap:
+                self._resolve(job, exc=e)
+            self._heap.clear()
+
+    async def _schedule(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._prune(now)
+            if not self._heap:
+                # простаиваем: просыпаемся хотя бы раз в PRUNE_INTERVAL, пока есть бакеты чатов
+                job, wait = None, (PRUNE_INTERVAL if self._chats else None)
+            else:
+                job, wait = self._pick(now)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._heap.remove(job)
+            heapq.heapify(self._heap)
+            self._global_bucket(job.bot).take(now)
+            self._chat_bucket(job.key).take(now)
+            task = asyncio.create_task(self._execute(job, now))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, job: _Job, started: float) -> None:
+        lane = self._stats[Priority(job.priority)]
+        waited = started - job.enqueued
+        try:
+            result = await job.make_request(job.bot, job.method)
+        except TelegramRetryAfter as e:
+            if job.retries < self.max_retries:
+                job.retries += 1
+                lane.retried += 1
+                logger.warning(f"Flood control в чате {job.chat_id}: ждём {e.retry_after} c (попытка {job.retries})")
+                # 429 может прийти и от лимита на чат, и от общего лимита бота — замораживаем оба
+                self._chat_bucket(job.key).block(e.retry_after)
+                self._global_bucket(job.bot).block(e.retry_after)
+                heapq.heappush(self._heap, job)
+                self._wakeup.set()
+                return
+            lane.failed += 1
+            self._resolve(job, exc=e)
+            return
+        except Exception as e:
+            lane.failed += 1
+            self._resolve(job, exc=e)
+            return
+        lane.sent += 1
+        lane.wait_total += waited
+        lane.wait_max = max(lane.wait_max, waited)
+        if waited >= self.slow_wait:
+            logger.warning(f"Сообщение в чат {job.chat_id} ждало в очереди {waited:.2f} c ({Priority(job.priority).name})")
+        self._resolve(job, result=result)
+
+    @staticmethod
+    def _resolve(job: _Job, *, result: Any = None, exc: Optional[BaseException] = None) -> None:
+        for fut in job.futures:
+            if fut.done():
+                continue
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(result)
+
+    # --- метрики / остановка ---
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Счётчики и время ожидания по полосам + текущая длина очереди."""
+        out = {p.name.lower(): s.as_dict() for p, s in self._stats.items()}
+        out["queue"] = {"pending": len(self._heap), "inflight": len(self._inflight)}
+        return out
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Дождаться отправки хвоста очереди и остановить планировщик."""
+        deadline = time.monotonic() + timeout
+        while (self._heap or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        for job in self._heap:
+            self._resolve(job, exc=RuntimeError("send queue closed"))
+        self._heap.clear()
+        logger.info(f"Очередь отправки остановлена: {self.stats()}")
+
+def from_env() -> SendQueue:
+    """Собрать очередь из переменных окружения (SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MERGE)."""
+    return SendQueue(
+        global_rate=env_num("SEND_GLOBAL_RATE", 30.0),
+        chat_rate=env_num("SEND_CHAT_RATE", 1.0),
+        chat_burst=env_num("SEND_CHAT_BURST", 3.0),
+        merge=env_flag("SEND_MERGE", False),
+    )
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Несколько ботов-фотографов в одном процессе.
+— Тенант = свой BOT_TOKEN, OWNER_ID, каталог цен (prices.json) и каталог данных
+  (sessions, leads.csv, рассылки, статистика).
+— Текущий тенант живёт в contextvar: его выставляет outer-middleware по боту, получившему апдейт,
+  а memory_store / booking_router / price_catalog и т.д. берут пути из `current()`.
+— Общие на всех: Dispatcher и роутеры, движок FAQ, HTTP-сессия Telegram, клиент OpenAI.
+
+Без tenants.json работает как раньше: один бот из BOT_TOKEN/OWNER_ID, данные в data/.
+Команды на весь процесс (/net, /gpt_stats, /profile) — только администратору: ADMIN_ID из .env
+(можно несколько через запятую), по умолчанию — владелец первого тенанта.
+Формат tenants.json (список):
+    [
+      {"name": "olka", "token_env": "BOT_TOKEN", "owner_id_env": "OWNER_ID", "data_dir": "data"},
+      {"name": "masha", "token_env": "MASHA_BOT_TOKEN", "owner_id": 123456, "prices": "tenants/masha/prices.json"}
+    ]
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from envcfg import env_num
+
+if TYPE_CHECKING:  # модуль нужен memory_store и бенчмаркам — без импорта aiogram
+    from aiogram.types import Message, TelegramObject
+
+ROOT = Path(__file__).parent
+
+env_path = ROOT / ".env"
+if env_path.exists():
+    load_dotenv(env_path)
+
+TENANTS_FILE = Path(os.getenv("TENANTS_FILE", "") or ROOT / "tenants.json")
+DATA_ROOT = Path(os.getenv("DATA_ROOT", "") or ROOT / "data")
+
+@dataclass(frozen=True)
+class Tenant:
+    name: str
+    token: str
+    owner_id: int
+    data_dir: Path
+    prices_path: Path
+
+    @property
+    def sessions_dir(self) -> Path:
+        return self.data_dir / "sessions"
+
+    @property
+    def leads_path(self) -> Path:
+        return self.data_dir / "leads.csv"
+
+    @property
+    def bot_id(self) -> int:
+        return int(self.token.split(":", 1)[0]) if ":" in self.token else 0
+
+def _default() -> Tenant:
+    return Tenant(
+        name="default",
+        token=os.getenv("BOT_TOKEN", "").strip(),
+        owner_id=env_num("OWNER_ID", 0),
+        data_dir=DATA_ROOT,
+        prices_path=ROOT / "prices.json",
+    )
+
+DEFAULT = _default()
+_current: ContextVar[Tenant] = ContextVar("tenant", default=DEFAULT)
+
+def current() -> Tenant:
+    return _current.get()
+
+def activate(tenant: Tenant):
+    """Сделать тенанта текущим (возвращает токен для `_current.reset`)."""
+    return _current.set(tenant)
+
+@contextmanager
+def using(tenant: Tenant) -> Iterator[Tenant]:
+    """Временно сделать тенанта текущим (проверки на старте, фоновые задачи)."""
+    token = activate(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+def is_owner(message: Message) -> bool:
+    """Фильтр для команд владельца: OWNER_ID текущего тенанта."""
+    owner = current().owner_id
+    return bool(owner) and message.from_user is not None and message.from_user.id == owner
+
+def _admin_ids(raw: str, fallback: int) -> frozenset:
+    ids = set()
+    for part in raw.replace(" ", "").split(","):
+        if part.isdigit():
+            ids.add(int(part))
+        elif part:
+            logger.warning(f"ADMIN_ID: {part!r} — не число, пропускаем")
+    return frozenset(ids) or (frozenset({fallback}) if fallback else frozenset())
+
+_admins = _admin_ids(os.getenv("ADMIN_ID", ""), DEFAULT.owner_id)
+
+def is_admin(message: Message) -> bool:
+    """Фильтр для команд на весь процесс (сеть, GPT, профилирование): ADMIN_ID, а не владелец бота."""
+    return message.from_user is not None and message.from_user.id in _admins
+
+# ---------- КОНФИГ ----------
+
+def _from_entry(entry: Dict[str, Any]) -> Tenant:
+    name = entry["name"]
+    token = entry.get("token") or os.getenv(entry.get("token_env", ""), "")
+    data_dir = Path(entry["data_dir"]) if entry.get("data_dir") else DATA_ROOT / "tenants" / name
+    prices = Path(entry.get("prices") or "prices.json")
+    return Tenant(
+        name=name,
+        token=token.strip(),
+        owner_id=_owner_id(entry),
+        data_dir=data_dir if data_dir.is_absolute() else ROOT / data_dir,
+        prices_path=prices if prices.is_absolute() else ROOT / prices,
+    )
+
+def _owner_id(entry: Dict[str, Any]) -> int:
+    """owner_id из tenants.json или из переменной owner_id_env; не число — предупреждение и 0 (без команд владельца)."""
+    raw = entry.get("owner_id")
+    if not raw:
+        return env_num(entry["owner_id_env"], 0) if entry.get("owner_id_env") else 0
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        logger.warning(f"tenants.json: owner_id тенанта {entry['name']} = {raw!r} — не число, берём 0")
+        return 0
+
+def _prices_problem(path: Path) -> Optional[str]:
+    if not path.exists():
+        return "нет файла"
+    try:
+        json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        return str(e)
+    return None
+
+def load() -> List[Tenant]:
+    """Список тенантов из tenants.json или один тенант по умолчанию из .env.
+    Заодно выставляет администраторов процесса (см. `is_admin`)."""
+    global _admins
+    if TENANTS_FILE.exists():
+        tenants = [_from_entry(e) for e in json.loads(TENANTS_FILE.read_text(encoding="utf-8"))]
+    else:
+        tenants = [DEFAULT]
+    missing = [t.name for t in tenants if not t.token]
+    if missing:
+        raise RuntimeError(f"Пустой токен бота у тенантов: {', '.join(missing)}. Укажите токены в .env")
+    names = [t.name for t in tenants]
+    if len(set(names)) != len(names):
+        raise RuntimeError("Имена тенантов в tenants.json должны быть уникальны")
+    problems = {t.name: _prices_problem(t.prices_path) for t in tenants}
+    broken = [f"{t.name} ({t.prices_path}: {problems[t.name]})" for t in tenants if problems[t.name]]
+    if broken:
+        raise RuntimeError(f"Не читается prices.json у тенантов: {'; '.join(broken)}")
+    _admins = _admin_ids(os.getenv("ADMIN_ID", ""), tenants[0].owner_id)
+    return tenants
+
+# ---------- MIDDLEWARE / МЕТРИКИ ----------
+
+@dataclass
+class TenantStats:
+    updates: int = 0
+    errors: int = 0
+    busy_ms: float = 0.0
+    max_ms: float = 0.0
+    started: float = field(default_factory=time.monotonic)
+
+    def as_text(self, name: str) -> str:
+        avg = self.busy_ms / self.updates if self.updates else 0.0
+        uptime_h = (time.monotonic() - self.started) / 3600
+        return (f"Тенант {name}: апдейтов {self.updates}, ошибок {self.errors}, "
+                f"ср. {avg:.1f} мс, макс. {self.max_ms:.0f} мс, аптайм {uptime_h:.1f} ч")
+
+class TenantMiddleware:
+    """Outer-middleware на update: по боту выбирает тенанта и считает его метрики."""
+
+    def __init__(self, tenants: List[Tenant]) -> None:
+        self.by_bot: Dict[int, Tenant] = {t.bot_id: t for t in tenants}
+        self.stats: Dict[str, TenantStats] = {t.name: TenantStats() for t in tenants}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        bot = data.get("bot")
+        tenant: Optional[Tenant] = self.by_bot.get(bot.id) if bot is not None else None
+        if tenant is None:
+            return await handler(event, data)
+        token = activate(tenant)
+        stats = self.stats[tenant.name]
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - t0) * 1000
+            stats.updates += 1
+            stats.busy_ms += elapsed
+            stats.max_ms = max(stats.max_ms, elapsed)
+            _current.reset(token)
+
+    def report(self, name: Optional[str] = None) -> str:
+        items = [(name, self.stats[name])] if name in self.stats else self.stats.items()
+        return "\n".join(s.as_text(n) for n, s in items)
+
+def log_stats(mw: TenantMiddleware) -> None:
+    for name, s in mw.stats.items():
+        logger.info(s.as_text(name))
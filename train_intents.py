@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+Офлайн-обучение классификатора намерений (intent_model.py) и отчёт на отложенной выборке.
+
+    python train_intents.py                         # обучить, записать intent_model.bin, напечатать отчёт
+    python train_intents.py --report report.md      # то же + отчёт в файл
+    python train_intents.py --check                 # exit 1, если точность на тесте ниже --min-accuracy
+                                                    # или хоть одно «другое» из теста принято за FAQ;
+                                                    # артефакт — во временный каталог, intent_model.bin не трогаем
+
+Данные:
+— триггеры INTENTS (+ зашумлённые копии: пропуск/перестановка букв);
+— intent_corpus.jsonl — размеченные вручную запросы {"intent": "...", "text": "..."}, включая «другое»;
+  делится детерминированно (по хэшу текста) на train / val / test = 50 / 25 / 25 % внутри каждой метки;
+  строки с "split": "test" (известные ложные срабатывания: «спасибо большое», «хочу отменить заказ») — всегда в тесте;
+— logs/dialog_log.txt — запрос пользователя, на который FAQ ответил (по заголовку ответа),
+  и запрос, после которого пользователь нажал кнопку-подсказку (строка `suggest`). Ответы самого
+  классификатора (`bot_clf`) не используются. Только в train.
+
+Калибровка: температура softmax подбирается по NLL на val, там же — порог вероятности,
+при котором точность ответов не ниже --target-precision, но не ниже --min-threshold: на val всего
+несколько примеров на метку, и порог по ним одним получается оптимистичным. Нужен numpy.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import intent_model
+from intent_model import OTHER, IntentModel
+from knowledge_base import INTENTS, answers, get_faq_answer, normalize
+
+ROOT = Path(__file__).parent
+CORPUS = ROOT / "intent_corpus.jsonl"
+DIALOG_LOG = ROOT / "logs" / "dialog_log.txt"
+LOG_LINE = re.compile(r"^\[[^\]]+\] (\d+) (\w+): (.*)$")
+
+Example = Tuple[str, str]   # (текст, метка)
+
+# ---------- ДАННЫЕ ----------
+
+def load_corpus(path: Path) -> Tuple[List[Example], List[Example]]:
+    """(строки для разбиения, строки с "split": "test" — всегда в отложенной выборке)."""
+    rows: List[Example] = []
+    pinned: List[Example] = []
+    with path.open(encoding="utf-8") as f:
+        for r in map(json.loads, f):
+            if r.get("text"):
+                (pinned if r.get("split") == "test" else rows).append((r["text"], r["intent"]))
+    return rows, pinned
+
+def split_corpus(rows: List[Example]) -> Tuple[List[Example], List[Example], List[Example]]:
+    """Стратифицированно и воспроизводимо: порядок внутри метки — по crc32 текста."""
+    by_label: Dict[str, List[Example]] = defaultdict(list)
+    for row in rows:
+        by_label[row[1]].append(row)
+    train, val, test = [], [], []
+    for items in by_label.values():
+        items.sort(key=lambda r: zlib.crc32(r[0].encode("utf-8")))
+        q = max(1, len(items) // 4)
+        test += items[:q]
+        val += items[q:2 * q]
+        train += items[2 * q:]
+    return train, val, test
+
+def _fingerprint(text: str) -> str:
+    return normalize(text)[:40]
+
+def harvest(path: Path) -> List[Example]:
+    """Размеченные запросы из dialog_log.txt: ответ FAQ на запрос и клики по подсказкам."""
+    if not path.exists():
+        return []
+    heads = {_fingerprint(ans): key for key, ans in answers().items()}
+    keys = {intent.key for intent in INTENTS}
+    last_query: Dict[str, str] = {}
+    pending: Dict[str, Tuple[str, set]] = {}   # uid -> (запрос, показанные подсказки)
+    out: List[Example] = []
+    with path.open(encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = LOG_LINE.match(line.rstrip("\n"))
+            if not m:
+                continue
+            uid, role, text = m.groups()
+            if role == "user":
+                click = pending.pop(uid, None)
+                if click and text in click[1]:
+                    out.append((click[0], text))
+                elif not text.startswith("/") and text not in keys:
+                    last_query[uid] = text
+                else:
+                    last_query.pop(uid, None)
+            elif role == "suggest" and uid in last_query:
+                pending[uid] = (last_query.pop(uid), set(text.split("|")))
+            elif role == "bot" and uid in last_query:
+                key = heads.get(_fingerprint(text))
+                if key:
+                    out.append((last_query.pop(uid), key))
+            else:   # ответ классификатора (bot_clf) и прочее — не разметка
+                last_query.pop(uid, None)
+    return out
+
+def _noisy(text: str, rng: random.Random) -> str:
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    op = rng.randrange(3)
+    if op == 0:
+        return text[:i] + text[i + 1:]                       # пропуск буквы
+    if op == 1:
+        return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]   # перестановка
+    return text[:i] + text[i] + text[i:]                     # удвоение
+
+def augment(rows: List[Example], copies: int, rng: random.Random) -> List[Example]:
+    return rows + [(_noisy(t, rng), y) for t, y in rows for _ in range(copies)]
+
+# ---------- МОДЕЛЬ ----------
+
+def matrix(rows: List[Example], dim: int, ngram: Tuple[int, int]) -> np.ndarray:
+    x = np.zeros((len(rows), dim), dtype=np.float32)
+    for i, (text, _) in enumerate(rows):
+        for j, v in intent_model.features(text, dim, ngram).items():
+            x[i, j] = v
+    return x
+
+def softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+def fit(x: np.ndarray, y: np.ndarray, k: int, *, epochs: int, lr: float, l2: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Softmax-регрессия, полный батч, Adam; веса классов — обратно частоте."""
+    n, d = x.shape
+    w = np.zeros((d, k), dtype=np.float32)
+    b = np.zeros(k, dtype=np.float32)
+    onehot = np.eye(k, dtype=np.float32)[y]
+    freq = np.bincount(y, minlength=k).astype(np.float32)
+    cw = (n / (k * np.maximum(freq, 1)))[y][:, None]
+    mw, vw, mb, vb = np.zeros_like(w), np.zeros_like(w), np.zeros_like(b), np.zeros_like(b)
+    b1, b2, eps = 0.9, 0.999, 1e-8
+    for t in range(1, epochs + 1):
+        g = (softmax(x @ w + b) - onehot) * cw / n
+        gw = x.T @ g + l2 * w
+        gb = g.sum(axis=0)
+        mw = b1 * mw + (1 - b1) * gw
+        vw = b2 * vw + (1 - b2) * gw * gw
+        mb = b1 * mb + (1 - b1) * gb
+        vb = b2 * vb + (1 - b2) * gb * gb
+        corr = np.sqrt(1 - b2 ** t) / (1 - b1 ** t)
+        w -= lr * corr * mw / (np.sqrt(vw) + eps)
+        b -= lr * corr * mb / (np.sqrt(vb) + eps)
+    return w, b
+
+def fit_temperature(z: np.ndarray, y: np.ndarray) -> float:
+    best_t, best_nll = 1.0, float("inf")
+    for t in np.exp(np.linspace(np.log(0.1), np.log(5.0), 60)):
+        p = softmax(z / t)
+        nll = -np.log(p[np.arange(len(y)), y] + 1e-12).mean()
+        if nll < best_nll:
+            best_t, best_nll = float(t), nll
+    return best_t
+
+def pick_threshold(p: np.ndarray, y: np.ndarray, other: int, target: float, floor: float) -> float:
+    """Минимальный порог не ниже floor, при котором ответы (не «другое», p ≥ порога) точны не хуже target."""
+    top, conf = p.argmax(axis=1), p.max(axis=1)
+    for thr in np.arange(floor, 0.96, 0.01):
+        answered = (top != other) & (conf >= thr)
+        if answered.any() and (top[answered] == y[answered]).mean() >= target:
+            return round(float(thr), 2)
+    return 0.95
+
+# ---------- ОТЧЁТ ----------
+
+def ece(p: np.ndarray, y: np.ndarray, bins: int = 10) -> float:
+    conf, right = p.max(axis=1), (p.argmax(axis=1) == y)
+    edges = np.linspace(0, 1, bins + 1)
+    total = 0.0
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        mask = (conf > lo) & (conf <= hi)
+        if mask.any():
+            total += mask.mean() * abs(conf[mask].mean() - right[mask].mean())
+    return float(total)
+
+def per_class(pred: np.ndarray, y: np.ndarray, labels: List[str]) -> List[Tuple[str, float, float, float, int]]:
+    rows = []
+    for j, name in enumerate(labels):
+        tp = int(((pred == j) & (y == j)).sum())
+        fp = int(((pred == j) & (y != j)).sum())
+        fn = int(((pred != j) & (y == j)).sum())
+        prec = tp / (tp + fp) if tp + fp else 0.0
+        rec = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * prec * rec / (prec + rec) if prec + rec else 0.0
+        rows.append((name, prec, rec, f1, tp + fn))
+    return rows
+
+def routing(model: IntentModel, test: List[Example]) -> Dict[str, int]:
+    """Как распределится трафик теста: только FAQ против FAQ + классификатор."""
+    stats = Counter()
+    for text, label in test:
+        res = get_faq_answer(text)
+        if res.answer:
+            stats["faq_right" if res.intent_key == label else "faq_wrong"] += 1
+            continue
+        pred = intent_model.classify(text)
+        if pred is None:
+            stats["gpt_other" if label == OTHER else "gpt_missed"] += 1
+        else:
+            stats["clf_right" if pred.intent == label else "clf_wrong"] += 1
+    return dict(stats)
+
+def latency_us(model: IntentModel, texts: List[str], rounds: int = 20) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            model.predict(text)
+    return (time.perf_counter() - t0) * 1e6 / (rounds * len(texts))
+
+def report(model: IntentModel, metrics: Dict, per: List, route: Dict[str, int], n_test: int) -> str:
+    lines = [
+        f"# Классификатор намерений {model.version}",
+        "",
+        f"Обучение: {metrics['examples']} примеров (корпус {metrics['corpus_train']}, триггеры {metrics['triggers']}, "
+        f"из dialog_log {metrics['harvested']}), val {metrics['val']}, test {n_test}.",
+        f"Признаки: n-граммы {model.ngram[0]}–{model.ngram[1]}, {model.dim} корзин; температура {model.temperature:.2f}, "
+        f"порог {model.threshold:.2f}.",
+        "",
+        "## Тест (отложенная выборка)",
+        f"- точность top-1: {metrics['accuracy']:.3f}, macro-F1: {metrics['macro_f1']:.3f}",
+        f"- ECE: {metrics['ece_raw']:.3f} без калибровки → {metrics['ece']:.3f} с температурой",
+        f"- при пороге: отвечаем на {metrics['coverage']:.0%} запросов про FAQ, точность ответов {metrics['precision']:.3f}; "
+        f"«другое» ошибочно принято за FAQ: {metrics['other_leak']}",
+        f"- инференс: {metrics['latency_us']:.0f} мкс/запрос (numpy: {'да' if model._np is not None else 'нет'})",
+        "",
+        "| метка | точность | полнота | F1 | n |",
+        "|---|---|---|---|---|",
+    ]
+    lines += [f"| {name} | {p:.2f} | {r:.2f} | {f:.2f} | {n} |" for name, p, r, f, n in per]
+    faq = route.get("faq_right", 0) + route.get("faq_wrong", 0)
+    clf = route.get("clf_right", 0) + route.get("clf_wrong", 0)
+    lines += [
+        "",
+        "## Маршрутизация теста: FAQ → классификатор → GPT",
+        f"- FAQ ответил: {faq} (верно {route.get('faq_right', 0)})",
+        f"- классификатор ответил: {clf} (верно {route.get('clf_right', 0)})",
+        f"- ушло в подсказки/GPT: {route.get('gpt_missed', 0)} про FAQ + {route.get('gpt_other', 0)} «другое»",
+        f"- без классификатора в подсказки/GPT ушло бы {n_test - faq}, с ним — {n_test - faq - clf}",
+    ]
+    return "\n".join(lines)
+
+# ---------- MAIN ----------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", type=Path, default=CORPUS)
+    ap.add_argument("--dialog-log", type=Path, default=DIALOG_LOG)
+    ap.add_argument("--out", type=Path, help="куда записать артефакт (по умолчанию intent_model.bin; при --check — временный файл)")
+    ap.add_argument("--report", type=Path, help="куда записать отчёт (markdown)")
+    ap.add_argument("--dim", type=int, default=4096, help="число корзин хэша (степень двойки)")
+    ap.add_argument("--epochs", type=int, default=300)
+    ap.add_argument("--lr", type=float, default=0.05)
+    ap.add_argument("--l2", type=float, default=1e-4)
+    ap.add_argument("--augment", type=int, default=3, help="зашумлённых копий на пример")
+    ap.add_argument("--target-precision", type=float, default=0.9)
+    ap.add_argument("--min-threshold", type=float, default=0.6, help="нижняя граница порога уверенности")
+    ap.add_argument("--seed", type=int, default=13)
+    ap.add_argument("--check", action="store_true", help="вернуть код 1, если точность на тесте ниже --min-accuracy или «другое» из теста принято за FAQ")
+    ap.add_argument("--min-accuracy", type=float, default=0.8)
+    args = ap.parse_args()
+    if args.dim & (args.dim - 1):
+        ap.error("--dim должен быть степенью двойки")
+
+    rng = random.Random(args.seed)
+    ngram = (2, 4)
+    corpus, pinned = load_corpus(args.corpus)
+    train_c, val, test = split_corpus(corpus)
+    test += pinned
+    triggers = [(t, intent.key) for intent in INTENTS for t in intent.triggers]
+    harvested = harvest(args.dialog_log)
+    train = augment(train_c + triggers + harvested, args.augment, rng)
+
+    labels = [intent.key for intent in INTENTS] + [OTHER]
+    index = {name: j for j, name in enumerate(labels)}
+    unknown = {y for _, y in corpus + pinned + harvested if y not in index}
+    if unknown:
+        print(f"Неизвестные метки в данных: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 1
+
+    def xy(rows: List[Example]) -> Tuple[np.ndarray, np.ndarray]:
+        return matrix(rows, args.dim, ngram), np.array([index[y] for _, y in rows])
+
+    x_tr, y_tr = xy(train)
+    x_val, y_val = xy(val)
+    x_te, y_te = xy(test)
+    w, b = fit(x_tr, y_tr, len(labels), epochs=args.epochs, lr=args.lr, l2=args.l2)
+
+    temperature = fit_temperature(x_val @ w + b, y_val)
+    other = index[OTHER]
+    threshold = pick_threshold(softmax((x_val @ w + b) / temperature), y_val, other, args.target_precision, args.min_threshold)
+
+    z_te = x_te @ w + b
+    p_te = softmax(z_te / temperature)
+    pred = p_te.argmax(axis=1)
+    conf = p_te.max(axis=1)
+    answered = (pred != other) & (conf >= threshold)
+    faq_rows = y_te != other
+    per = per_class(pred, y_te, labels)
+    metrics = {
+        "examples": len(train), "corpus_train": len(train_c), "triggers": len(triggers),
+        "harvested": len(harvested), "val": len(val), "test": len(test),
+        "accuracy": float((pred == y_te).mean()),
+        "macro_f1": float(np.mean([f for _, _, _, f, _ in per])),
+        "ece_raw": ece(softmax(z_te), y_te),
+        "ece": ece(p_te, y_te),
+        "coverage": float((answered & faq_rows).sum() / max(faq_rows.sum(), 1)),
+        "precision": float((pred[answered] == y_te[answered]).mean()) if answered.any() else 0.0,
+        "other_leak": int((answered & ~faq_rows).sum()),
+    }
+
+    weights = np.ascontiguousarray(w, dtype="<f4").tobytes()
+    bias = np.ascontiguousarray(b, dtype="<f4").tobytes()
+    header = {
+        "format": intent_model.FORMAT,
+        "version": f"{datetime.now():%Y%m%d}-{hashlib.sha1(weights + bias).hexdigest()[:8]}",
+        "labels": labels, "dim": args.dim, "ngram": list(ngram),
+        "temperature": round(temperature, 4), "threshold": threshold,
+        "metrics": {k: round(v, 4) if isinstance(v, float) else v for k, v in metrics.items()},
+    }
+    data = intent_model.encode(header, weights, bias)
+    model = IntentModel.from_bytes(data)
+    metrics["latency_us"] = latency_us(model, [t for t, _ in test])
+
+    out = args.out or (Path(tempfile.mkdtemp(prefix="train_intents_")) / intent_model.MODEL_PATH.name
+                       if args.check else intent_model.MODEL_PATH)
+    out.write_bytes(data)
+    intent_model.load(out)   # маршрутизация теста — ровно тем, что будет в боте
+    text = report(model, metrics, per, routing(model, test), len(test))
+    print(text)
+    print(f"\nАртефакт: {out} ({len(data) / 1024:.0f} КБ)")
+    if args.report:
+        args.report.write_text(text + "\n", encoding="utf-8")
+    if not args.check:
+        return 0
+    failed = False
+    if metrics["accuracy"] < args.min_accuracy:
+        print(f"FAIL: точность на тесте {metrics['accuracy']:.3f} < {args.min_accuracy}", file=sys.stderr)
+        failed = True
+    leaks = [t for t, y in test if y == OTHER and intent_model.classify(t) is not None]
+    if leaks:
+        print(f"FAIL: «другое» принято за FAQ: {', '.join(leaks)}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())